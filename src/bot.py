@@ -4,8 +4,11 @@ Optimized for Raspberry Pi / Linux Environments.
 """
 
 import asyncio
+import concurrent.futures
 import datetime
 import difflib
+import functools
+import itertools
 import logging
 import os
 import platform
@@ -17,24 +20,25 @@ import subprocess
 import sys
 import time
 import unicodedata
+from collections import OrderedDict, deque
 from uuid import uuid4
 
 import discord
-import psutil
 import requests
-import yt_dlp
 from discord import app_commands, ui
 from discord.ext import commands, tasks
 
 from config import (
-    CACHE_DIR, CACHE_MAP_FILE, COLOR_MAIN, FFMPEG_LOCAL_OPTS, FFMPEG_STREAM_OPTS,
-    MAX_CACHE_SIZE_GB, PLAYLIST_FILE, SETTINGS_FILE, TOKEN, YDL_DOWNLOAD_OPTS,
-    YDL_FLAT_OPTS, YDL_MIX_OPTS, YDL_PLAY_OPTS, YDL_PLAYLIST_LOAD_OPTS,
-    YDL_SEARCH_OPTS, COMMON_YDL_ARGS, YDL_SINGLE_OPTS
+    CACHE_DIR, CACHE_MAP_FILE, COLOR_MAIN, DOWNLOAD_WORKERS, FFMPEG_LOCAL_OPTS, FFMPEG_STREAM_OPTS,
+    ALONE_GRACE, IDLE_TIMEOUT, MAX_CACHE_SIZE_GB, SETTINGS_FILE, TOKEN, YDL_DOWNLOAD_OPTS,
+    YDL_FLAT_OPTS, YDL_MIX_OPTS, YDL_PLAY_OPTS, YDL_PLAYLIST_INFO_OPTS, YDL_PLAYLIST_LOAD_OPTS,
+    YDL_PLAYLIST_REST_OPTS, YDL_SINGLE_OPTS
 )
 from utils import (
-    log_error, log_info, load_json, save_json, format_time, 
-    enforce_cache_limit, get_thumbnail_url, cache_map, saved_playlists, server_settings
+    log_error, log_info, save_json_later, flush_pending_saves, get_ydl,
+    extract_search, system_stats, ydl_extract, Track, save_playlists, URL_PREFIXES, LIST_PARAM_RE,
+    enforce_cache_limit, cache_map, cache_index, cache_stats, saved_playlists,
+    server_settings, log_listener
 )
 
 # ==========================================
@@ -54,8 +58,35 @@ if not TOKEN:
 
 if not os.path.exists(CACHE_DIR): 
     os.makedirs(CACHE_DIR)
+cache_index.scan()
 
-from web import app, set_bot_instance
+@functools.lru_cache(maxsize=8)
+def _stream_opts(header_items):
+    """FFmpeg options for a stream with the given HTTP headers; yt-dlp sends the same few sets all session."""
+    header_args = "".join([f"{key}: {value}\r\n" for key, value in header_items])
+    return {**FFMPEG_STREAM_OPTS, 'before_options': f'{FFMPEG_STREAM_OPTS["before_options"]} -headers "{header_args}"'}
+
+# Stripped from titles and guesses before comparing them in the guess game
+_GUESS_NOISE_RE = re.compile(r'\(.*?\)|\[.*?\]|official|video|audio|lyrics|feat\.|ft\.| - topic|remix|hd|4k')
+_GUESS_SYMBOLS_RE = re.compile(r'[^a-z0-9\s\-]')
+_TUNNEL_URL_RE = re.compile(r'https://[a-zA-Z0-9-]+\.trycloudflare.com')
+
+try:
+    from rapidfuzz.fuzz import ratio as _fuzz_ratio # Optional C++ implementation, much faster than difflib
+except ImportError:
+    _fuzz_ratio = None
+
+def _similarity(a, b, cutoff):
+    """Similarity ratio (0-1) of a and b, or 0.0 when it is known to be below cutoff."""
+    if _fuzz_ratio: return _fuzz_ratio(a, b, score_cutoff=cutoff * 100) / 100
+    m = difflib.SequenceMatcher(None, a, b)
+    if m.real_quick_ratio() < cutoff or m.quick_ratio() < cutoff: return 0.0
+    return m.ratio()
+
+# Channel names preferred for bot notifications when no channel is bound with /setchannel
+_CHANNEL_HINTS = ('music', 'muzica', 'bot', 'general')
+
+from web import serve_dashboard, set_bot_instance
 
 # ==========================================
 # 5. DISCORD UI CLASSES
@@ -63,17 +94,63 @@ from web import app, set_bot_instance
 
 class ServerState:
     """Stores the music state for a single guild."""
+    __slots__ = ('queue', 'current_track', 'last_interaction', 'processing_next', 'history', 'autoplay',
+                 'fetching_autoplay', 'stopping', 'last_text_channel', 'notification_channel_id', 'game',
+                 'next_prepared', 'autoplay_task', 'mix_cache', 'version', 'status_cache',
+                 'changed', 'last_shuffle_notice', 'idle_handle', 'now_playing_message')
+    MIX_CACHE_SIZE = 8
+
+    # Shared across guilds and seeded from the clock so versions never repeat after a restart
+    _versions = itertools.count(int(time.time() * 1000))
+
     def __init__(self):
-        self.queue = []
+        self.queue = deque()
         self.current_track = None
-        self.last_interaction = datetime.datetime.now()
+        self.last_interaction = time.monotonic()
         self.processing_next = False 
-        self.history = []
+        self.history = deque(maxlen=20)
         self.autoplay = False
         self.fetching_autoplay = False
         self.stopping = False
         self.last_text_channel = None 
+        self.notification_channel_id = None # Fallback channel found by scanning guild.text_channels
         self.game = None
+        self.next_prepared = None # (track_id, Task) resolving the upcoming song's audio source
+        self.autoplay_task = None
+        self.mix_cache = OrderedDict() # seed id -> mix entries, so regenerating doesn't re-extract
+        self.version = next(self._versions) # Bumped by notify(); every dashboard-visible mutation must notify
+        self.status_cache = None # (version, serialized dashboard status), see web.status_bytes
+        self.changed = asyncio.Event() # Replaced on every notify(); dashboard websockets wait on it
+        self.last_shuffle_notice = 0.0 # monotonic time of the last shuffle button confirmation
+        self.idle_handle = None # TimerHandle for the pending idle check, see MusicBot.schedule_idle_check
+        self.now_playing_message = None # Latest Now Playing message; the only one discord.py tracks per guild
+
+    def status_version(self):
+        """Returns a version number that changes whenever the dashboard-visible state changes."""
+        return self.version
+
+    def drop_suggestions(self):
+        """Removes the autoplay suggestions from the queue."""
+        if any(t.suggested for t in self.queue):
+            self.queue = deque(t for t in self.queue if not t.suggested)
+            self.notify()
+
+    def shuffle(self):
+        """Shuffles the user-added tracks; autoplay suggestions stay at the end."""
+        user_queue, suggested = [], []
+        for t in self.queue:
+            (suggested if t.suggested else user_queue).append(t)
+        random.shuffle(user_queue) # on a list: random.shuffle indexes into the middle, O(n) per access on a deque
+        user_queue.extend(suggested)
+        self.queue = deque(user_queue)
+        self.notify()
+
+    def notify(self):
+        """Bumps the status version and wakes the dashboard websockets after a change to the current track,
+        queue or autoplay flag."""
+        self.version = next(self._versions)
+        self.changed.set()
+        self.changed = asyncio.Event()
 
 
 class SelectionMenu(ui.Select):
@@ -81,14 +158,19 @@ class SelectionMenu(ui.Select):
     def __init__(self, entries, cog, ctx):
         options = []
         for entry in entries[:10]:
-            title = (entry.get('title', 'Unknown')[:90] + '..') if len(entry.get('title', '')) > 90 else entry.get('title', 'Unknown')
-            val = f"https://www.youtube.com/watch?v={entry['id']}" if entry.get('id') else entry.get('url')
-            if val: options.append(discord.SelectOption(label=title, value=val))
+            vid = entry.get('id')
+            val = f"https://www.youtube.com/watch?v={vid}" if vid else entry.get('url')
+            if not val: continue
+            title = entry.get('title') or 'Unknown'
+            if len(title) > 90: title = title[:90] + '..'
+            options.append(discord.SelectOption(label=title, value=val))
         super().__init__(placeholder="Select a song...", options=options)
         self.cog, self.ctx = cog, ctx
 
     async def callback(self, interaction):
         if interaction.user != self.ctx.author: return
+        # Done with the view: stop its timeout so it is released now and doesn't later overwrite this with "expired"
+        self.view.stop()
         await interaction.response.edit_message(content="✅ **Confirmed.**", view=None)
         await self.cog.prepare_song(self.ctx, self.values[0])
 
@@ -97,7 +179,8 @@ class SelectionView(ui.View):
     """View container for the selection menu."""
     def __init__(self, entries, cog, ctx):
         super().__init__(timeout=30)
-        self.add_item(SelectionMenu(entries, cog, ctx))
+        menu = SelectionMenu(entries, cog, ctx)
+        if menu.options: self.add_item(menu) # Discord rejects a select without options; callers check view.children
         self.message = None
 
     async def on_timeout(self):
@@ -110,44 +193,48 @@ class SelectionView(ui.View):
 
 
 class MusicControlView(ui.View):
-    """Persistent buttons for the 'Now Playing' message."""
-    def __init__(self, cog, guild_id):
+    """Persistent buttons for the 'Now Playing' message. One instance serves every guild and survives restarts."""
+    def __init__(self, cog):
         super().__init__(timeout=None)
-        self.cog, self.guild_id = cog, guild_id
+        self.cog = cog
 
-    @ui.button(emoji="⏯️", style=discord.ButtonStyle.blurple)
+    @ui.button(emoji="⏯️", style=discord.ButtonStyle.blurple, custom_id="music:play_pause")
     async def play_pause(self, interaction, button):
         vc = interaction.guild.voice_client
         if vc: 
             if vc.is_paused(): vc.resume()
-            elif vc.is_playing(): vc.pause()
+            elif vc.is_playing():
+                vc.pause()
+                self.cog.start_idle(interaction.guild.id)
         await interaction.response.defer()
 
-    @ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary)
+    @ui.button(emoji="⏭️", style=discord.ButtonStyle.secondary, custom_id="music:skip")
     async def skip(self, interaction, button):
         if interaction.guild.voice_client: interaction.guild.voice_client.stop()
         await interaction.response.defer()
 
-    @ui.button(emoji="🔀", style=discord.ButtonStyle.secondary)
+    @ui.button(emoji="🔀", style=discord.ButtonStyle.secondary, custom_id="music:shuffle")
     async def shuffle(self, interaction, button):
-        state = self.cog.get_state(self.guild_id)
-        user_queue = [t for t in state.queue if not t.get('suggested')]
-        suggested = [t for t in state.queue if t.get('suggested')]
-        random.shuffle(user_queue)
-        state.queue[:] = user_queue + suggested
+        state = self.cog.get_state(interaction.guild.id)
+        state.shuffle()
+        self.cog.prefetch_next(interaction.guild.id)
+        # Repeated clicks still shuffle, but only the first in a burst gets a confirmation message
+        now = time.monotonic()
+        if now - state.last_shuffle_notice < 1.0: return await interaction.response.defer()
+        state.last_shuffle_notice = now
         await interaction.response.send_message("🔀 Shuffled queue!", ephemeral=True, silent=True)
 
-    @ui.button(emoji="📋", style=discord.ButtonStyle.gray)
+    @ui.button(emoji="📋", style=discord.ButtonStyle.gray, custom_id="music:queue")
     async def q_btn(self, interaction, button):
-        state = self.cog.get_state(self.guild_id)
+        state = self.cog.get_state(interaction.guild.id)
         if not state.current_track and not state.queue:
             return await interaction.response.send_message("Queue empty!", ephemeral=True, silent=True)
         view = ListPaginator(state.queue, title="Server Queue", is_queue=True, current=state.current_track)
         await interaction.response.send_message(embed=view.get_embed(), view=view, ephemeral=True, silent=True)
 
-    @ui.button(emoji="⏹️", style=discord.ButtonStyle.danger)
+    @ui.button(emoji="⏹️", style=discord.ButtonStyle.danger, custom_id="music:stop")
     async def stop_btn(self, interaction, button):
-        await self.cog.stop_logic(self.guild_id)
+        await self.cog.stop_logic(interaction.guild.id)
         await interaction.response.send_message("👋 Stopping & Saving...", ephemeral=True, silent=True)
 
 
@@ -223,7 +310,9 @@ class GuessGame:
         self.ctx = ctx
         self.seed_song = seed_song
         self.mode = mode # "title", "author", or "both"
-        self.songs_pool = []
+        self.songs_pool = deque()
+        self.pooled_ids = set() # ids currently in songs_pool
+        self.stream_infos = {} # song id -> future extracting its stream info; only the current and next song are kept
         self.current_song = None
         self.play_duration = 5
         self.active = True
@@ -234,9 +323,10 @@ class GuessGame:
         self.transitioning = False
         self.lock = asyncio.Lock()
         self.played_ids = set()
-        self.history = [] # List of {type: 'guess'|'event', user: str, text: str, correct: bool}
+        self.history = deque(maxlen=50) # {type: 'guess'|'event', user: str, text: str, correct: bool}, oldest dropped
         self.last_reveal = None # Stores {title: str, author: str, id: str} for display between rounds
         self.current_start_time = None # Random start time for current song segment
+        self.clean_title = self.clean_author = None # clean_text() of current_song's fields, set in next_song
 
     def add_to_history(self, event_type, user, text, correct=False):
         self.history.append({
@@ -246,11 +336,12 @@ class GuessGame:
             'correct': correct,
             'time': datetime.datetime.now().strftime("%H:%M:%S")
         })
-        if len(self.history) > 50: self.history.pop(0)
 
     def remove_diacritics(self, text):
         """Removes Romanian diacritics and other accents."""
-        return "".join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+        if text.isascii(): return text # Most guesses; NFD can't add marks to ASCII
+        category = unicodedata.category
+        return "".join([c for c in unicodedata.normalize('NFD', text) if category(c) != 'Mn'])
 
     async def fetch_more_songs(self, seed_id=None):
         """Uses autoplay logic to find related songs for the game."""
@@ -258,14 +349,13 @@ class GuessGame:
         sid = seed_id or self.seed_song['id']
         try:
             url = f"https://www.youtube.com/watch?v={sid}&list=RD{sid}"
-            info = await self.cog.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_MIX_OPTS).extract_info(url, download=False))
+            info = await ydl_extract(self.cog.bot.loop, YDL_MIX_OPTS, url, background=True)
             if 'entries' in info:
-                # Strictly filter out already played IDs and already pooled IDs
-                pooled_ids = {s['id'] for s in self.songs_pool}
-                new_entries = [e for e in info['entries'] if e and e['id'] not in self.played_ids and e['id'] not in pooled_ids]
-                
+                # Strictly filter out already played IDs and already pooled IDs (including repeats within this mix)
                 added_count = 0
-                for e in new_entries:
+                for e in info['entries']:
+                    if not e or e['id'] in self.played_ids or e['id'] in self.pooled_ids: continue
+                    self.pooled_ids.add(e['id'])
                     track = {
                         'id': e['id'], 
                         'title': e['title'], 
@@ -275,7 +365,9 @@ class GuessGame:
                     self.songs_pool.append(track)
                     added_count += 1
                 
-                random.shuffle(self.songs_pool)
+                pool = list(self.songs_pool) # random.shuffle on a deque is O(n) per swap
+                random.shuffle(pool)
+                self.songs_pool = deque(pool)
                 log_info(f"🎮 GuessGame: Added {added_count} new songs to pool using seed {sid}")
         except Exception as e:
             log_error(f"Guess Game pool fetch failed: {e}")
@@ -353,15 +445,26 @@ class GuessGame:
             await self.ctx.send("🔄 Refreshing song pool...")
             await self.fetch_more_songs(seed_id=new_seed)
         
-        # Final safety filter
-        self.songs_pool = [s for s in self.songs_pool if s['id'] not in self.played_ids]
+        # Pooled ids are never played (see fetch_more_songs); the head check is only a cheap safety net
+        while self.songs_pool and self.songs_pool[0]['id'] in self.played_ids:
+            self.pooled_ids.discard(self.songs_pool.popleft()['id'])
         
         if not self.songs_pool:
             await self.ctx.send("❌ Could not find enough unique songs. Ending game.")
             return await self.stop()
 
-        self.current_song = self.songs_pool.pop(0)
+        self.current_song = self.songs_pool.popleft()
+        self.pooled_ids.discard(self.current_song['id'])
         self.played_ids.add(self.current_song['id'])
+        # Resolve the next round's stream while this one is being guessed, so transitions skip the extraction
+        keep = {self.current_song['id']}
+        if self.songs_pool: keep.add(self.songs_pool[0]['id'])
+        for vid in list(self.stream_infos):
+            if vid not in keep: self.stream_infos.pop(vid).cancel()
+        for vid in keep: self.stream_info(vid)
+        # Every guess is compared against these, so clean them once per song
+        self.clean_title = self.clean_text(self.current_song['title'])
+        self.clean_author = self.clean_text(self.current_song['author'])
         self.play_duration = 5
         self.processing_guess = False
         self.transitioning = False
@@ -395,7 +498,7 @@ class GuessGame:
 
             try:
                 # Use flat opts to get info quickly
-                info = await self.cog.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_PLAY_OPTS).extract_info(self.current_song['id'], download=False))
+                info = await asyncio.shield(self.stream_info(self.current_song['id']))
                 opts = FFMPEG_STREAM_OPTS.copy()
                 opts['options'] = f"-vn -threads 2 -bufsize 8192k -t {self.play_duration}"
                 
@@ -415,17 +518,29 @@ class GuessGame:
                         except: pass
             except Exception as e:
                 log_error(f"Guess Game Play Error: {e}")
+                self.stream_infos.pop(self.current_song['id'], None) # Don't keep serving a failed extraction
                 if self.active and not self.transitioning:
                     await self.next_song()
 
+    def stream_info(self, vid):
+        """Future resolving the playable stream for `vid`, shared by every segment of that round."""
+        task = self.stream_infos.get(vid)
+        if task is None:
+            # ydl_extract already hands back a (shielded) future, so it is stored as-is rather than wrapped in a task
+            task = self.stream_infos[vid] = ydl_extract(
+                self.cog.bot.loop, YDL_PLAY_OPTS, vid, background=vid != self.current_song['id'])
+            # A prefetch that fails and is never played is still "retrieved", so asyncio doesn't warn about it
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return task
+
     def clean_text(self, text):
         """Standardizes text for comparison."""
         text = text.lower()
         text = self.remove_diacritics(text)
         # Remove common suffixes/prefixes for music
-        text = re.sub(r'\(.*?\)|\[.*?\]|official|video|audio|lyrics|feat\.|ft\.| - topic|remix|hd|4k', '', text).strip()
+        text = _GUESS_NOISE_RE.sub('', text).strip()
         # Keep only alphanumeric and a few important symbols for 'both' mode
-        text = re.sub(r'[^a-z0-9\s\-]', '', text)
+        text = _GUESS_SYMBOLS_RE.sub('', text)
         # Normalize spaces
         text = " ".join(text.split())
         return text
@@ -438,34 +553,29 @@ class GuessGame:
         if len(clean_guess) < 2: return False
         
         if self.mode == "both":
-            target_author = self.clean_text(self.current_song['author'])
-            target_title = self.clean_text(self.current_song['title'])
+            target_author = self.clean_author
+            target_title = self.clean_title
             
-            author_match = difflib.SequenceMatcher(None, clean_guess, target_author).ratio() > 0.6 or target_author in clean_guess
-            title_match = difflib.SequenceMatcher(None, clean_guess, target_title).ratio() > 0.6 or target_title in clean_guess
+            author_match = target_author in clean_guess or _similarity(clean_guess, target_author, 0.6) > 0.6
+            title_match = target_title in clean_guess or _similarity(clean_guess, target_title, 0.6) > 0.6
             
             return author_match and title_match
 
-        target_text = self.current_song['title'] if self.mode == "title" else self.current_song['author']
-        clean_target = self.clean_text(target_text)
+        clean_target = self.clean_title if self.mode == "title" else self.clean_author
         
         # Anti-author check for title mode (prevent guessing artist when title is needed)
         if self.mode == "title":
-            clean_author = self.clean_text(self.current_song['author'])
-            author_ratio = difflib.SequenceMatcher(None, clean_guess, clean_author).ratio()
+            author_ratio = _similarity(clean_guess, self.clean_author, 0.85)
             if author_ratio > 0.85:
                 # If guess matches author too well, check if it ALSO matches title
-                title_ratio = difflib.SequenceMatcher(None, clean_guess, clean_target).ratio()
+                title_ratio = _similarity(clean_guess, clean_target, 0.7)
                 if title_ratio < 0.7:
                     return False
 
-        ratio = difflib.SequenceMatcher(None, clean_guess, clean_target).ratio()
-        is_correct = ratio > 0.8
-        if not is_correct and len(clean_guess) > 3:
-            if clean_guess in clean_target or clean_target in clean_guess:
-                is_correct = True
-        
-        return is_correct
+        # Containment is a C-level scan; only fall back to the fuzzy ratio when it doesn't settle it
+        if len(clean_guess) > 3 and (clean_guess in clean_target or clean_target in clean_guess):
+            return True
+        return _similarity(clean_guess, clean_target, 0.8) > 0.8
 
     async def check_guess(self, message):
         """Discord message handler for guesses."""
@@ -507,6 +617,8 @@ class GuessGame:
 
     async def stop(self):
         self.active = False
+        for task in self.stream_infos.values(): task.cancel()
+        self.stream_infos.clear()
         state = self.cog.get_state(self.ctx.guild.id)
         state.game = None
         if self.ctx.voice_client and self.ctx.voice_client.is_playing():
@@ -531,45 +643,95 @@ class GuessGame:
 
 class ListPaginator(ui.View):
     """Pagination for queue, history, and cache lists."""
+    PAGE_CACHE_SIZE = 4 # previous, current, next and one spare
+    EDIT_COOLDOWN = 0.15 # seconds; arrow clicks inside this window are folded into one message edit
+
     def __init__(self, data_list, title="List", is_queue=True, current=None):
         super().__init__(timeout=60)
-        self.data_list = data_list
+        # Snapshot: the view shows the list as it was when opened, so rendered pages stay valid
+        self.data_list = list(data_list)
         self.title = title
         self.is_queue = is_queue
         self.current = current
         self.page = 0
         self.items_per_page = 10
-        self.max_pages = max(0, (len(data_list) - 1) // self.items_per_page)
+        self._total = len(self.data_list)
+        self.max_pages = max(0, (self._total - 1) // self.items_per_page)
+        self._page_cache = OrderedDict() # page -> Embed, the few most recently shown
+        self._edit_task = None
+        self._latest = None # Most recent arrow interaction, used for the trailing edit
+        # Every list passed in holds one kind of row, so the formatter is picked once here
+        is_tracks = bool(self.data_list) and isinstance(self.data_list[0], (dict, Track))
+        self._format_row = self._format_track if is_tracks else self._format_plain
+        # Answered from the in-memory cache index rather than a stat() on the event loop
+        self._source = "💾 Local" if current and current['id'] in cache_index else "☁️ Stream"
+
+    @staticmethod
+    def _format_track(n, s):
+        prefix = "✨ " if s.get('suggested') else ""
+        return f"`{n}.` {prefix}**{s['title']}** by {s.get('author', 'Unknown')} ({s.get('duration', '?:??')})"
+
+    @staticmethod
+    def _format_plain(n, s):
+        return f"`{n}.` {s}"
 
     def get_embed(self):
+        embed = self._page_cache.get(self.page)
+        if embed is not None:
+            self._page_cache.move_to_end(self.page)
+            return embed
         embed = discord.Embed(title=f"📜 {self.title}", color=COLOR_MAIN)
         if self.is_queue and self.current:
-            source = "💾 Local" if os.path.exists(f"{CACHE_DIR}/{self.current['id']}.webm") else "☁️ Stream"
-            embed.add_field(name=f"▶️ Now Playing ({source})", value=f"**{self.current['title']}**", inline=False)
+            embed.add_field(name=f"▶️ Now Playing ({self._source})", value=f"**{self.current['title']}**", inline=False)
+        # Only the visible window is formatted, so opening a paginator over a huge list costs one page
         start = self.page * self.items_per_page
-        end = start + self.items_per_page
-        if not self.data_list: desc = "Empty."
-        else:
-            desc_lines = []
-            for i, s in enumerate(self.data_list[start:end]):
-                if isinstance(s, dict): 
-                    prefix = "✨ " if s.get('suggested') else ""
-                    line = f"`{start+i+1}.` {prefix}**{s['title']}** by {s.get('author', 'Unknown')} ({s.get('duration', '?:??')})"
-                else: line = f"`{start+i+1}.` {s}"
-                desc_lines.append(line)
-            desc = "\n".join(desc_lines)
-        embed.description = desc
-        embed.set_footer(text=f"Page {self.page+1}/{self.max_pages+1} • Total: {len(self.data_list)}")
+        rows = self.data_list[start:start + self.items_per_page]
+        embed.description = "\n".join([self._format_row(start + i, s) for i, s in enumerate(rows, 1)]) or "Empty."
+        embed.set_footer(text=f"Page {self.page+1}/{self.max_pages+1} • Total: {self._total}")
+        self._page_cache[self.page] = embed
+        if len(self._page_cache) > self.PAGE_CACHE_SIZE: self._page_cache.popitem(last=False)
         return embed
 
     @ui.button(emoji="⬅️", style=discord.ButtonStyle.gray)
     async def prev(self, interaction, button):
-        if self.page > 0: self.page -= 1
-        await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        await self.turn(interaction, max(0, self.page - 1))
     @ui.button(emoji="➡️", style=discord.ButtonStyle.gray)
     async def next(self, interaction, button):
-        if self.page < self.max_pages: self.page += 1
+        await self.turn(interaction, min(self.max_pages, self.page + 1))
+
+    async def turn(self, interaction, page):
+        # Clicking past either end just acknowledges the interaction instead of re-sending the same page
+        if page == self.page: return await interaction.response.defer()
+        self.page = page
+        self._latest = interaction
+        # While a recent edit is settling, clicks only move self.page; _settle sends the final page once
+        if self._edit_task: return await interaction.response.defer()
         await interaction.response.edit_message(embed=self.get_embed(), view=self)
+        self._edit_task = asyncio.create_task(self._settle())
+
+    async def _settle(self):
+        shown = self.page
+        try:
+            while True:
+                await asyncio.sleep(self.EDIT_COOLDOWN)
+                if self.page == shown: return
+                shown = self.page
+                await self._latest.edit_original_response(embed=self.get_embed(), view=self)
+        except discord.HTTPException: pass
+        finally: self._edit_task = None
+
+
+def _build_help_embed():
+    """The /help embed; its content is static, so the cog builds it once."""
+    embed = discord.Embed(title="🎵 PiMusic Bot Commands", description="Control your music with these commands:", color=COLOR_MAIN)
+    embed.add_field(name="🎵 Music", value="`/play [song]` - Play music\n`/pause` / `/resume`\n`/skip`\n`/stop`\n`/autoplay`\n`/new` - Regen recommendation", inline=False)
+    embed.add_field(name="🎛️ Dashboard", value="`/link` - Get Web Panel\n`/setchannel` - Set output channel", inline=False)
+    embed.add_field(name="📂 Playlists", value="`/saveplaylist`\n`/loadplaylist`\n`/listplaylists`\n`/delplaylist`", inline=False)
+    embed.add_field(name="📜 Queue", value="`/queue`\n`/history`\n`/shuffle`\n`/clear`", inline=False)
+    embed.add_field(name="🎮 Games", value="`/guess [search]` - Start song quiz", inline=False)
+    embed.add_field(name="⚙️ Utils", value="`/search`\n`/cache`\n`/dash`", inline=False)
+    return embed
+
 
 # ==========================================
 # 6. MAIN MUSIC BOT CLASS
@@ -580,27 +742,46 @@ class MusicBot(commands.Cog):
         self.bot = bot
         self.states = {}
         self.cleanup_loop.start()
+        self.cache_evict_loop.start()
         self.tunnel_monitor.start()
         self.public_url = None
         self.web_auth_token = str(uuid4())
         self.tunnel_proc = None
         self.drain_task = None
+        self.background_tasks = set() # Strong references for fire-and-forget tasks, see spawn()
+        # Shared by every Now Playing message; custom_ids let buttons on old messages keep working after a restart
+        self.control_view = MusicControlView(self)
+        bot.add_view(self.control_view)
+        self.help_embed = _build_help_embed()
+        
+        # Background downloads: bounded worker pool separate from the default executor
+        self.download_pool = concurrent.futures.ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="ytdl")
+        self.download_queue = asyncio.Queue()
+        self.pending_downloads = set()
+        self.download_workers = [self.bot.loop.create_task(self.download_worker()) for _ in range(DOWNLOAD_WORKERS)]
         
         # Store direct reference for reliable access in Quart
-        app.config['BOT_COG'] = self
-        set_bot_instance(bot)
+        set_bot_instance(bot, self)
         
         global bot_instance
         bot_instance = bot 
-        self.web_task = self.bot.loop.create_task(app.run_task(host='0.0.0.0', port=5000))
+        self.web_task = self.bot.loop.create_task(serve_dashboard(host='0.0.0.0', port=5000))
         
         # Pre-start Cloudflared
-        self.bot.loop.create_task(self.start_cloudflared())
+        self.spawn(self.start_cloudflared())
 
     async def cog_unload(self):
+        set_bot_instance(self.bot)
+        for state in self.states.values():
+            if state.now_playing_message: self.untrack_control_message(state.now_playing_message.id)
+        self.control_view.stop() # Unregisters the persistent (message-less) entry from the bot's view store
+        flush_pending_saves()
         self.cleanup_loop.stop()
+        self.cache_evict_loop.stop()
         self.tunnel_monitor.stop()
         if self.drain_task: self.drain_task.cancel()
+        for worker in self.download_workers: worker.cancel()
+        self.download_pool.shutdown(wait=False, cancel_futures=True)
         if self.tunnel_proc:
             try: 
                 self.tunnel_proc.terminate()
@@ -643,7 +824,7 @@ class MusicBot(commands.Cog):
                 line = line.decode('utf-8')
                 # Still look for the URL if not found yet (backup)
                 if not self.public_url and "trycloudflare.com" in line:
-                    match = re.search(r'https://[a-zA-Z0-9-]+\.trycloudflare.com', line)
+                    match = _TUNNEL_URL_RE.search(line)
                     if match:
                         self.public_url = match.group(0)
                         log_info(f"🌍 Tunnel Active (found in drain): {self.public_url}")
@@ -735,6 +916,25 @@ class MusicBot(commands.Cog):
                 await state.game.stop()
                 if state.last_text_channel:
                     await state.last_text_channel.send("⚠️ Bot disconnected from VC. Game stopped.", silent=True)
+            return
+
+        # Someone left the bot's channel: give them a moment to come back, then check if it's alone
+        vc = member.guild.voice_client
+        if vc and before.channel == vc.channel and after.channel != vc.channel and member.guild.id in self.states:
+            self.schedule_idle_check(member.guild.id, ALONE_GRACE)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        state = self.states.get(channel.guild.id)
+        if not state: return
+        if state.notification_channel_id == channel.id: state.notification_channel_id = None
+        if state.last_text_channel and state.last_text_channel.id == channel.id: state.last_text_channel = None
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        # A rename or permission change can change which channel the name hints pick
+        state = self.states.get(after.guild.id)
+        if state and state.notification_channel_id == after.id: state.notification_channel_id = None
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
@@ -766,32 +966,45 @@ class MusicBot(commands.Cog):
 
     # --- Playback Logic ---
 
-    async def background_download(self, track):
-        """Proactively download a song in the background with low priority."""
+    def background_download(self, track):
+        """Queues a song for proactive low-priority download."""
         # Check if already cached or being downloaded
-        if os.path.exists(f"{CACHE_DIR}/{track['id']}.webm"):
+        if track['id'] in self.pending_downloads or os.path.exists(f"{CACHE_DIR}/{track['id']}.webm"):
             return
+        self.pending_downloads.add(track['id'])
+        self.download_queue.put_nowait(track)
+
+    def download_track(self, track):
+        """Downloads a song into the cache (Synchronous, runs on the download pool)."""
+        try:
+            # Lower process priority even more for the download thread if possible
+            if platform.system() != "Windows":
+                try: os.nice(19) 
+                except: pass
             
-        await enforce_cache_limit(self.bot.loop)
-        
-        def do_download():
+            # Download threads keep their own YDL instance
+            get_ydl(YDL_DOWNLOAD_OPTS).download([f'https://www.youtube.com/watch?v={track["id"]}'])
+            
+            cache_index.add(track['id'])
+            cache_map[track['id']] = track['title']
+            save_json_later(self.bot.loop, CACHE_MAP_FILE, cache_map)
+            log_info(f"✅ Background Cached: {track['title']}")
+        except Exception as e:
+            log_error(f"Background DL Fail for {track['id']}: {e}")
+
+    async def download_worker(self):
+        """Consumes the download queue; DOWNLOAD_WORKERS of these run side by side."""
+        while True:
+            track = await self.download_queue.get()
             try:
-                # Lower process priority even more for the download thread if possible
-                if platform.system() != "Windows":
-                    try: os.nice(19) 
-                    except: pass
-                
-                # Use a specific YDL instance for background tasks
-                with yt_dlp.YoutubeDL(YDL_DOWNLOAD_OPTS) as ydl:
-                    ydl.download([f'https://www.youtube.com/watch?v={track["id"]}'])
-                
-                cache_map[track['id']] = track['title']
-                save_json(CACHE_MAP_FILE, cache_map)
-                log_info(f"✅ Background Cached: {track['title']}")
+                await self.bot.loop.run_in_executor(self.download_pool, self.download_track, track)
+                # Cheap size check; only scans/deletes once the new file pushed us over the limit
+                await enforce_cache_limit(self.bot.loop)
             except Exception as e:
-                log_error(f"Background DL Fail for {track['id']}: {e}")
-
-        await self.bot.loop.run_in_executor(None, do_download)
+                log_error(f"Download worker error: {e}")
+            finally:
+                self.pending_downloads.discard(track['id'])
+                self.download_queue.task_done()
 
     async def stop_logic(self, guild_id):
         """Clean disconnect logic."""
@@ -801,16 +1014,63 @@ class MusicBot(commands.Cog):
         guild = self.bot.get_guild(guild_id)
         state = self.states[guild_id]
         state.stopping = True
+        if state.next_prepared: state.next_prepared[1].cancel()
+        if state.autoplay_task: state.autoplay_task.cancel()
+        if state.idle_handle: state.idle_handle.cancel()
+        if state.now_playing_message: self.untrack_control_message(state.now_playing_message.id)
         
         if guild and guild.voice_client:
             await guild.voice_client.disconnect()
             
         del self.states[guild_id]
-
-    @tasks.loop(minutes=2)
+        state.notify() # Dashboard sockets move on to the guild's next state
+
+    def spawn(self, coro):
+        """create_task for fire-and-forget work. The loop only keeps weak references to tasks, so an unreferenced
+        one can be garbage collected mid-run; this holds it until it finishes."""
+        task = self.bot.loop.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    def start_idle(self, guild_id):
+        """Playback just stopped or paused: the idle timeout counts from now."""
+        state = self.states.get(guild_id)
+        if not state: return
+        state.last_interaction = time.monotonic()
+        self.schedule_idle_check(guild_id, IDLE_TIMEOUT)
+
+    def schedule_idle_check(self, guild_id, delay):
+        """(Re)arms the guild's idle check to run in `delay` seconds; only the latest one stays pending."""
+        state = self.states.get(guild_id)
+        if not state: return
+        if state.idle_handle: state.idle_handle.cancel()
+        state.idle_handle = self.bot.loop.call_later(delay, lambda: self.spawn(self.idle_check(guild_id)))
+
+    async def idle_check(self, guild_id):
+        """Auto-disconnect if alone or idle. Re-arms itself while the guild is idle but not yet past the timeout."""
+        state = self.states.get(guild_id)
+        if not state: return
+        state.idle_handle = None
+        guild = self.bot.get_guild(guild_id)
+        if not guild:
+            del self.states[guild_id]
+            return
+        vc = guild.voice_client
+        if not vc: return
+
+        if len(vc.channel.members) == 1:
+            return await self.stop_logic(guild_id)
+        # Playing: the next empty queue in play_next re-arms the check
+        if vc.is_playing() or (state.game and state.game.active): return
+        idle_for = time.monotonic() - state.last_interaction
+        if idle_for > IDLE_TIMEOUT: return await self.stop_logic(guild_id)
+        self.schedule_idle_check(guild_id, IDLE_TIMEOUT - idle_for)
+
+    @tasks.loop(minutes=10)
     async def cleanup_loop(self):
-        """Auto-disconnect if alone or idle."""
-        now = datetime.datetime.now()
+        """Safety net for idle cases no event covers (e.g. joined via /link but nothing ever played); see idle_check."""
+        now = time.monotonic()
         for gid in list(self.states.keys()):
             guild = self.bot.get_guild(gid)
             if not guild:
@@ -822,13 +1082,34 @@ class MusicBot(commands.Cog):
                 # FIX: Reset the timer while music is playing
                 if guild.voice_client.is_playing():
                     state.last_interaction = now
+                elif not state.idle_handle:
+                    self.schedule_idle_check(gid, 0)
+            await asyncio.sleep(0) # Housekeeping, let queued commands run between guilds
 
-                is_alone = len(guild.voice_client.channel.members) == 1
-                game_active = state.game and state.game.active
-                is_idle = not guild.voice_client.is_playing() and not game_active and (now - state.last_interaction).total_seconds() > 300
-                
-                if is_alone or is_idle:
-                    await self.stop_logic(gid)
+    @tasks.loop(minutes=1)
+    async def cache_evict_loop(self):
+        """Periodic safety net for the cache size limit; also persists play times batched by touch()."""
+        await enforce_cache_limit(self.bot.loop)
+        if cache_index.touched:
+            await self.bot.loop.run_in_executor(None, cache_index.sync_mtimes)
+
+    def set_now_playing_message(self, state, message):
+        """Records the guild's newest Now Playing message and forgets the previous one.
+        send() registers the shared control view once per message and points the view at that message; without
+        this, every track would leave an entry behind and cog_unload's stop() would only clear the newest."""
+        if state.now_playing_message: self.untrack_control_message(state.now_playing_message.id)
+        state.now_playing_message = message
+        self.bot.add_view(self.control_view) # Point the view back at its persistent registration
+
+    def untrack_control_message(self, message_id):
+        """Drops discord.py's per-message entries for the control view. Its buttons keep working through the
+        persistent registration. ViewStore has no public call for the dispatch entry, only for the sync map."""
+        try:
+            store = self.bot._connection._view_store
+            store._views.pop(message_id, None)
+            store.remove_message_tracking(message_id)
+        except Exception as e: # Private API; if it changes, the cost is a stale entry, never playback or stop
+            log_error(f"Could not untrack control message: {e}")
 
     def get_notification_channel(self, guild):
         if str(guild.id) in server_settings:
@@ -840,33 +1121,39 @@ class MusicBot(commands.Cog):
         state = self.get_state(guild.id)
         if state.last_text_channel:
             return state.last_text_channel
-            
+
+        if state.notification_channel_id:
+            ch = guild.get_channel(state.notification_channel_id)
+            if ch and ch.permissions_for(guild.me).send_messages:
+                return ch
+
+        found = None
         for ch in guild.text_channels:
             if ch.permissions_for(guild.me).send_messages:
-                if any(x in ch.name.lower() for x in ['music', 'muzica', 'bot', 'general']):
-                    return ch
-                    
-        return guild.text_channels[0] if guild.text_channels else None
+                ch_name = ch.name.lower()
+                if any(x in ch_name for x in _CHANNEL_HINTS):
+                    found = ch
+                    break
+        if not found and guild.text_channels:
+            found = guild.text_channels[0]
+        state.notification_channel_id = found.id if found else None
+        return found
 
     async def load_rest_of_playlist(self, url, guild_id):
         """Background task to load large playlists."""
-        REST_OPTS = {'extract_flat': 'in_playlist', 'playlist_items': '51-', **COMMON_YDL_ARGS, 'noplaylist': False}
         try:
-            info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(REST_OPTS).extract_info(url, download=False))
+            info = await ydl_extract(self.bot.loop, YDL_PLAYLIST_REST_OPTS, url, background=True)
             if 'entries' in info:
                 state = self.get_state(guild_id)
                 count = 0
-                for e in info['entries']:
-                    if e: 
-                        state.queue.append({
-                            'id': e['id'], 
-                            'title': e['title'], 
-                            'author': e['uploader'], 
-                            'duration': format_time(e['duration']), 
-                            'duration_seconds': e['duration'], 
-                            'webpage': f"https://www.youtube.com/watch?v={e['id']}"
-                        })
-                        count += 1
+                entries = info['entries']
+                # Big playlists go in 25 at a time, yielding in between so the voice send loop isn't starved
+                for i in range(0, len(entries), 25):
+                    tracks = [Track.from_entry(e) for e in entries[i:i + 25] if e]
+                    state.queue.extend(tracks)
+                    count += len(tracks)
+                    await asyncio.sleep(0)
+                state.notify()
                 
                 guild = self.bot.get_guild(guild_id)
                 ch = self.get_notification_channel(guild)
@@ -882,7 +1169,7 @@ class MusicBot(commands.Cog):
         
         # 1. If Autoplay is OFF, remove any suggested tracks
         if not state.autoplay:
-            state.queue = [t for t in state.queue if not (isinstance(t, dict) and t.get('suggested'))]
+            state.drop_suggestions()
             return
 
         # Prevent concurrent fetches (unless forced, but even then we should be careful)
@@ -891,10 +1178,10 @@ class MusicBot(commands.Cog):
 
         # 2. Always maintain exactly one suggestion at the end. 
         # If forced, we clear and re-fetch. Otherwise, we only clear if it's not at the end.
-        suggestions = [t for t in state.queue if isinstance(t, dict) and t.get('suggested')]
+        suggestions = [t for t in state.queue if t.suggested]
         if suggestions:
-            if force or not state.queue[-1].get('suggested') or len(suggestions) > 1:
-                state.queue = [t for t in state.queue if not (isinstance(t, dict) and t.get('suggested'))]
+            if force or not state.queue[-1].suggested or len(suggestions) > 1:
+                state.drop_suggestions()
             else:
                 # Already have exactly one at the end and not forced
                 return
@@ -902,7 +1189,7 @@ class MusicBot(commands.Cog):
         # 3. Find a seed track (last user track in queue, or current)
         seed = None
         for t in reversed(state.queue):
-            if isinstance(t, dict) and not t.get('suggested'): 
+            if not t.suggested:
                 seed = t
                 break
         
@@ -914,34 +1201,39 @@ class MusicBot(commands.Cog):
         # 4. Fetch recommendation
         state.fetching_autoplay = True
         try:
-            # Run in executor to avoid blocking
-            info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_MIX_OPTS).extract_info(f"https://www.youtube.com/watch?v={seed['id']}&list=RD{seed['id']}", download=False))
-            if 'entries' in info:
-                # History check (last 20)
-                recent_ids = [h['id'] for h in state.history[-20:]]
+            entries = state.mix_cache.get(seed['id'])
+            if entries is None:
+                # Run in executor to avoid blocking
+                info = await ydl_extract(self.bot.loop, YDL_MIX_OPTS, f"https://www.youtube.com/watch?v={seed['id']}&list=RD{seed['id']}", background=True)
+                entries = [e for e in info.get('entries') or () if e]
+                state.mix_cache[seed['id']] = entries
+                if len(state.mix_cache) > state.MIX_CACHE_SIZE: state.mix_cache.popitem(last=False)
+            else:
+                state.mix_cache.move_to_end(seed['id'])
+
+            if entries:
+                # Everything we must not suggest (seed, explicit avoids, last 20 played, already queued),
+                # built once so each candidate is a single set lookup
+                skip_ids = {seed['id'], *avoid_ids}
+                skip_ids.update(h.id for h in state.history)
+                skip_ids.update(t.id for t in state.queue)
                 
                 # Filter candidates
                 candidates = []
-                for e in info['entries']:
-                    if not e: continue
-                    eid = e['id']
-                    if eid == seed['id']: continue
-                    if eid in avoid_ids: continue
-                    if eid in recent_ids: continue
-                    
-                    # Also avoid tracks already in queue
-                    if any(isinstance(t, dict) and t['id'] == eid for t in state.queue): continue
-                    
+                for e in entries:
+                    if e['id'] in skip_ids: continue
                     candidates.append(e)
                     if len(candidates) >= 5: break
                 
                 if candidates:
                     e = random.choice(candidates)
-                    track = {'id':e['id'], 'title':e['title'], 'author':e['uploader'], 'duration':format_time(e['duration']), 'duration_seconds':e['duration'], 'webpage':e['url'], 'suggested': True}
+                    track = Track.from_entry(e, suggested=True)
                     
                     # Double check no suggestions were added
-                    state.queue = [t for t in state.queue if not (isinstance(t, dict) and t.get('suggested'))]
+                    state.queue = deque(t for t in state.queue if not t.suggested)
                     state.queue.append(track)
+                    state.notify()
+                    self.prefetch_next(guild_id)
                     
         except Exception as e:
             log_error(f"Autoplay fetch failed: {e}")
@@ -954,8 +1246,9 @@ class MusicBot(commands.Cog):
         if not state.autoplay: return False
         
         # Find current suggestion
-        if state.queue and state.queue[-1].get('suggested'):
+        if state.queue and state.queue[-1].suggested:
             old_suggestion = state.queue.pop() # Remove it
+            state.notify()
             # Avoid this one, and also ensure we don't pick it again immediately
             await self.ensure_autoplay(guild_id, avoid_ids=[old_suggestion['id']], force=True)
             return True
@@ -975,12 +1268,12 @@ class MusicBot(commands.Cog):
                 await ctx.send("❌ Game is active! Cannot add songs.", silent=True)
             return
 
-        state.last_interaction = datetime.datetime.now()
+        state.last_interaction = time.monotonic()
         state.stopping = False
         if hasattr(ctx, 'channel'): state.last_text_channel = ctx.channel
         
         # 1. Aggressive clear (before potential awaits)
-        state.queue = [t for t in state.queue if not (isinstance(t, dict) and t.get('suggested'))]
+        state.drop_suggestions()
         
         # VC Join Logic
         if not ctx.voice_client:
@@ -998,7 +1291,10 @@ class MusicBot(commands.Cog):
         opts = YDL_SINGLE_OPTS if (not is_playlist and 'ytsearch' not in query) else YDL_FLAT_OPTS
 
         try:
-            info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(opts).extract_info(query, download=False))
+            if 'ytsearch' in query:
+                info = await extract_search(self.bot.loop, opts, query)
+            else:
+                info = await ydl_extract(self.bot.loop, opts, query)
         except Exception as e:
             msg = f"❌ Error extracting info: {str(e)[:100]}"
             if ctx.interaction: await ctx.interaction.followup.send(msg, ephemeral=True)
@@ -1006,41 +1302,31 @@ class MusicBot(commands.Cog):
             return
         
         # 2. Aggressive clear (after awaits, ensures we clear any suggestion added during info extraction)
-        state.queue = [t for t in state.queue if not (isinstance(t, dict) and t.get('suggested'))]
-
-        def proc(e): 
-            url = e.get('webpage_url') or e.get('url') or f"https://www.youtube.com/watch?v={e['id']}"
-            return {
-                'id': e['id'], 
-                'title': e['title'], 
-                'author': e.get('uploader', 'Unknown'), 
-                'duration': format_time(e.get('duration', 0)), 
-                'duration_seconds': e.get('duration', 0), 
-                'webpage': url
-            }
-        
+        state.drop_suggestions()
+
         async def send_res(msg):
             if ctx.interaction: await ctx.interaction.followup.send(embed=discord.Embed(description=msg, color=COLOR_MAIN), silent=True)
             else: await ctx.send(embed=discord.Embed(description=msg, color=COLOR_MAIN), silent=True)
 
         if 'entries' in info: 
-            tracks = [proc(e) for e in info['entries'] if e]
+            tracks = [Track.from_entry(e) for e in info['entries'] if e]
             if not tracks: return await send_res("❌ No tracks found.")
             state.queue.extend(tracks)
             await send_res(f"✅ Added **{len(tracks)}** tracks.")
             
             # Start pre-downloading first 3 tracks of a playlist
             for t in tracks[:3]:
-                self.bot.loop.create_task(self.background_download(t))
+                self.background_download(t)
         else: 
-            track = proc(info)
+            track = Track.from_entry(info)
             state.queue.append(track)
             if ctx.voice_client.is_playing(): await send_res(f"✅ Queued: **{info['title']}**")
             # Start pre-downloading immediately
-            self.bot.loop.create_task(self.background_download(track))
+            self.background_download(track)
+        state.notify()
             
         # Re-verify autoplay (moves suggestion to end)
-        self.bot.loop.create_task(self.ensure_autoplay(ctx.guild.id, force=True))
+        self.spawn(self.ensure_autoplay(ctx.guild.id, force=True))
 
         if not ctx.voice_client.is_playing(): await self.play_next(ctx)
 
@@ -1055,7 +1341,7 @@ class MusicBot(commands.Cog):
         
         try:
              # Just fetch basic info first to get title
-             info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL({'extract_flat': True, 'quiet': True}).extract_info(url, download=False))
+             info = await ydl_extract(self.bot.loop, YDL_PLAYLIST_INFO_OPTS, url)
              title = info.get('title', 'Unknown Playlist')
              
              # Sanitize title
@@ -1065,7 +1351,7 @@ class MusicBot(commands.Cog):
              # Avoid overwriting if possible, or just overwrite? Prompt says "saving it as a live playlist too".
              # Let's save it.
              saved_playlists[safe_title] = {'type': 'live', 'url': url}
-             save_json(PLAYLIST_FILE, saved_playlists)
+             save_playlists(self.bot.loop)
              
              await msg.edit(content=f"💾 Saved as **{safe_title}**. Queuing...")
              
@@ -1075,6 +1361,39 @@ class MusicBot(commands.Cog):
         except Exception as e:
             await msg.edit(content=f"❌ Error: {e}")
 
+    async def resolve_source(self, track):
+        """Resolves and probes the FFmpeg input for a track (local cache file or stream URL)."""
+        local = os.path.abspath(f"{CACHE_DIR}/{track['id']}.webm")
+        if os.path.exists(local) and os.path.getsize(local) > 1024:
+            src, opts, is_local = local, FFMPEG_LOCAL_OPTS, True
+        else:
+            info = await ydl_extract(self.bot.loop, YDL_PLAY_OPTS, track['id'])
+            
+            headers = info.get('http_headers')
+            opts = _stream_opts(tuple(headers.items())) if headers else FFMPEG_STREAM_OPTS
+            src, is_local = info['url'], False
+
+        codec, bitrate = await discord.FFmpegOpusAudio.probe(src)
+        return {'input': src, 'opts': opts, 'local': is_local, 'codec': codec, 'bitrate': bitrate}
+
+    async def _prefetch_source(self, track):
+        try:
+            return await self.resolve_source(track)
+        except Exception as e:
+            log_error(f"Prefetch failed for {track['id']}: {e}")
+            return None
+
+    def prefetch_next(self, guild_id):
+        """Starts resolving the head of the queue in the background so the next transition is gapless.
+        Call again whenever the head may have changed (shuffle, remove); a stale prefetch is cancelled."""
+        state = self.get_state(guild_id)
+        if not state.queue or not state.current_track: return
+        head = state.queue[0]
+        if state.next_prepared:
+            if state.next_prepared[0] == head['id']: return
+            state.next_prepared[1].cancel()
+        state.next_prepared = (head['id'], self.bot.loop.create_task(self._prefetch_source(head)))
+
     async def play_next(self, ctx):
         """Recursive function to play the next song in the queue."""
         state = self.get_state(ctx.guild.id)
@@ -1085,78 +1404,79 @@ class MusicBot(commands.Cog):
         
         if state.queue:
             state.processing_next = True 
-            next_song = state.queue.pop(0)
+            next_song = state.queue.popleft()
             state.current_track = next_song
             state.history.append(next_song)
-            if len(state.history) > 20: state.history.pop(0)
+            state.notify()
 
             try:
-                local = os.path.abspath(f"{CACHE_DIR}/{next_song['id']}.webm")
-                play_local = os.path.exists(local) and os.path.getsize(local) > 1024
-                
-                # Thumbnail Check
-                thumb_local = f"{CACHE_DIR}/{next_song['id']}.jpg"
-                if play_local and not os.path.exists(thumb_local):
-                    try: await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL({'writethumbnail':True, 'skip_download':True, 'outtmpl': f'{CACHE_DIR}/%(id)s.%(ext)s', 'quiet':True}).download([f"https://www.youtube.com/watch?v={next_song['id']}"])) # noqa
-                    except: pass
-
-                if play_local:
-                    os.utime(local, None)
-                    source = await discord.FFmpegOpusAudio.from_probe(local, **FFMPEG_LOCAL_OPTS)
+                # Use the source resolved while the previous song was playing, if it is for this track
+                prepared = None
+                if state.next_prepared:
+                    prepared_id, task = state.next_prepared
+                    state.next_prepared = None
+                    if prepared_id == next_song['id'] and not task.cancelled():
+                        prepared = await task
+                    else:
+                        task.cancel()
+                if prepared and prepared['local'] and not os.path.exists(prepared['input']):
+                    prepared = None # Evicted since it was prefetched
+                if not prepared:
+                    prepared = await self.resolve_source(next_song)
+
+                if prepared['local']:
+                    cache_index.touch(next_song['id'])
                 else:
                     # If not local, stream it, but also trigger a download for future use
-                    self.bot.loop.create_task(self.background_download(next_song))
-                    
-                    info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_PLAY_OPTS).extract_info(next_song['id'], download=False))
-                    
-                    opts = FFMPEG_STREAM_OPTS.copy()
-                    if 'http_headers' in info:
-                        header_args = ""
-                        for key, value in info['http_headers'].items():
-                            header_args += f"{key}: {value}\r\n"
-                        opts['before_options'] = f'-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5 -headers "{header_args}" -nostdin'
-                    
-                    source = await discord.FFmpegOpusAudio.from_probe(info['url'], **opts)
+                    self.background_download(next_song)
 
-                ctx.voice_client.play(source, after=lambda e: self.bot.loop.create_task(self.play_next(ctx)))
+                source = discord.FFmpegOpusAudio(prepared['input'], codec=prepared['codec'], bitrate=prepared['bitrate'], **prepared['opts'])
+                # `after` runs on discord.py's audio thread; hand play_next back to the loop thread-safely
+                ctx.voice_client.play(source, after=lambda e: asyncio.run_coroutine_threadsafe(self.play_next(ctx), self.bot.loop))
                 state.processing_next = False 
                 
-                # Proactively pre-download the NEW first song in the queue
+                # Proactively pre-download and resolve the NEW first song in the queue
                 if state.queue:
-                    self.bot.loop.create_task(self.background_download(state.queue[0]))
-                
-                # Trigger autoplay prefetch for the NEXT song
-                self.bot.loop.create_task(self.ensure_autoplay(ctx.guild.id))
+                    self.background_download(state.queue[0])
+                self.prefetch_next(ctx.guild.id)
                 
-                embed = discord.Embed(title="🎶 Now Playing", description=f"**[{next_song['title']}]({next_song['webpage']})**", color=COLOR_MAIN)
-                embed.set_thumbnail(url=f"https://i.ytimg.com/vi/{next_song['id']}/mqdefault.jpg")
-                embed.add_field(name="Author", value=next_song['author'])
-                embed.add_field(name="Duration", value=next_song['duration'])
-                if next_song.get('suggested'): embed.set_footer(text="✨ Autoplay Suggestion")
-                
-                ch = self.get_notification_channel(ctx.guild)
-                if ch: await ch.send(embed=embed, view=MusicControlView(self, ctx.guild.id), silent=True)
+                # Trigger autoplay prefetch for the NEXT song; runs alongside playback, cancelled on stop
+                state.autoplay_task = self.bot.loop.create_task(self.ensure_autoplay(ctx.guild.id))
             
             except Exception as e: 
                 log_error(f"Playback error: {e}")
                 state.processing_next = False
                 await asyncio.sleep(2) 
-                self.bot.loop.create_task(self.play_next(ctx))
+                self.spawn(self.play_next(ctx))
+            else:
+                # The track is already playing; a failed announcement must not be treated as a playback error
+                await self.announce_now_playing(ctx.guild, state, next_song)
         else:
             state.current_track = None
             state.processing_next = False
+            state.notify()
+            self.start_idle(ctx.guild.id)
+
+    async def announce_now_playing(self, guild, state, song):
+        """Posts the Now Playing card with the control buttons to the guild's notification channel."""
+        embed = discord.Embed(title="🎶 Now Playing", description=f"**[{song['title']}]({song['webpage']})**", color=COLOR_MAIN)
+        embed.set_thumbnail(url=f"https://i.ytimg.com/vi/{song['id']}/mqdefault.jpg")
+        embed.add_field(name="Author", value=song['author'])
+        embed.add_field(name="Duration", value=song['duration'])
+        if song.suggested: embed.set_footer(text="✨ Autoplay Suggestion")
+
+        ch = self.get_notification_channel(guild)
+        if not ch: return
+        try:
+            msg = await ch.send(embed=embed, view=self.control_view, silent=True)
+        except discord.HTTPException as e:
+            return log_error(f"Now Playing message error: {e}")
+        self.set_now_playing_message(state, msg)
 
     # --- COMMANDS ---
     @commands.hybrid_command(name="help", description="Show all commands")
     async def help(self, ctx):
-        embed = discord.Embed(title="🎵 PiMusic Bot Commands", description="Control your music with these commands:", color=COLOR_MAIN)
-        embed.add_field(name="🎵 Music", value="`/play [song]` - Play music\n`/pause` / `/resume`\n`/skip`\n`/stop`\n`/autoplay`\n`/new` - Regen recommendation", inline=False)
-        embed.add_field(name="🎛️ Dashboard", value="`/link` - Get Web Panel\n`/setchannel` - Set output channel", inline=False)
-        embed.add_field(name="📂 Playlists", value="`/saveplaylist`\n`/loadplaylist`\n`/listplaylists`\n`/delplaylist`", inline=False)
-        embed.add_field(name="📜 Queue", value="`/queue`\n`/history`\n`/shuffle`\n`/clear`", inline=False)
-        embed.add_field(name="🎮 Games", value="`/guess [search]` - Start song quiz", inline=False)
-        embed.add_field(name="⚙️ Utils", value="`/search`\n`/cache`\n`/dash`", inline=False)
-        await ctx.send(embed=embed, silent=True)
+        await ctx.send(embed=self.help_embed, silent=True)
 
     @commands.command()
     async def sync(self, ctx):
@@ -1166,7 +1486,8 @@ class MusicBot(commands.Cog):
     @commands.hybrid_command(name="setchannel")
     async def set_channel(self, ctx):
         server_settings[str(ctx.guild.id)] = ctx.channel.id
-        save_json(SETTINGS_FILE, server_settings)
+        self.get_state(ctx.guild.id).notification_channel_id = None
+        save_json_later(self.bot.loop, SETTINGS_FILE, server_settings)
         embed = discord.Embed(description=f"✅ Bound to {ctx.channel.mention}", color=COLOR_MAIN)
         await ctx.send(embed=embed, silent=True)
 
@@ -1196,9 +1517,9 @@ class MusicBot(commands.Cog):
     async def play(self, ctx, *, search: str):
         # Strip playlist if video is present
         if "v=" in search and "list=" in search:
-            search = re.sub(r'([&?])list=[^&]*', '', search)
+            search = LIST_PARAM_RE.sub('', search)
             
-        q = search if re.match(r'^https?://', search) else f"ytsearch1:{search}"
+        q = search if search.startswith(URL_PREFIXES) else f"ytsearch1:{search}"
         await self.prepare_song(ctx, q)
 
     @commands.hybrid_command(name="stop", aliases=["dc", "leave"])
@@ -1217,9 +1538,10 @@ class MusicBot(commands.Cog):
     async def clear(self, ctx):
         state = self.get_state(ctx.guild.id)
         if state.autoplay:
-            state.queue = [t for t in state.queue if t.get('suggested')]
+            state.queue = deque(t for t in state.queue if t.suggested)
         else:
-            state.queue = []
+            state.queue.clear()
+        state.notify()
         embed = discord.Embed(description="🗑️ Queue cleared.", color=COLOR_MAIN)
         await ctx.send(embed=embed, silent=True)
 
@@ -1235,6 +1557,7 @@ class MusicBot(commands.Cog):
     async def pause(self, ctx):
         if ctx.voice_client.is_playing(): 
             ctx.voice_client.pause()
+            self.start_idle(ctx.guild.id)
             await ctx.send(embed=discord.Embed(description="⏸️ Paused.", color=COLOR_MAIN), silent=True)
 
     @commands.hybrid_command(name="resume")
@@ -1246,10 +1569,8 @@ class MusicBot(commands.Cog):
     @commands.hybrid_command(name="shuffle")
     async def shuffle(self, ctx):
         state = self.get_state(ctx.guild.id)
-        user_queue = [t for t in state.queue if not t.get('suggested')]
-        suggested = [t for t in state.queue if t.get('suggested')]
-        random.shuffle(user_queue)
-        state.queue[:] = user_queue + suggested
+        state.shuffle()
+        self.prefetch_next(ctx.guild.id)
         await ctx.send(embed=discord.Embed(description="🔀 Shuffled.", color=COLOR_MAIN), silent=True)
 
     @commands.hybrid_command(name="saveplaylist")
@@ -1265,9 +1586,9 @@ class MusicBot(commands.Cog):
             if state.current_track: tracks.append(state.current_track)
             tracks.extend(state.queue)
             if not tracks: return await ctx.send(embed=discord.Embed(description="Queue empty.", color=discord.Color.red()), silent=True)
-            clean = [{'id':t['id'], 'title':t['title'], 'author':t['author'], 'duration':t['duration'], 'duration_seconds':t['duration_seconds'], 'webpage':t['webpage']} for t in tracks]
+            clean = [t.to_dict() for t in tracks]
             saved_playlists[name] = clean
-        save_json(PLAYLIST_FILE, saved_playlists)
+        save_playlists(self.bot.loop)
         await ctx.send(embed=discord.Embed(description=f"💾 Saved **{name}**.", color=COLOR_MAIN), silent=True)
 
     @commands.hybrid_command(name="loadplaylist")
@@ -1281,16 +1602,18 @@ class MusicBot(commands.Cog):
         content = saved_playlists[name]
         
         if isinstance(content, list):
-            state.queue.extend(content)
+            state.queue.extend(Track.from_dict(t) for t in content)
+            state.notify()
             await ctx.send(embed=discord.Embed(description=f"📂 Loaded **{len(content)}** songs.", color=COLOR_MAIN), silent=True)
         elif isinstance(content, dict):
             await ctx.send(embed=discord.Embed(description="🔄 Loading live playlist (First 50)...", color=COLOR_MAIN), silent=True)
             try:
-                info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_PLAYLIST_LOAD_OPTS).extract_info(content['url'], download=False))
-                tracks = [{'id':e['id'], 'title':e['title'], 'author':e['uploader'], 'duration':format_time(e['duration']), 'duration_seconds':e['duration'], 'webpage':f"https://www.youtube.com/watch?v={e['id']}"} for e in info['entries'] if e]
+                info = await ydl_extract(self.bot.loop, YDL_PLAYLIST_LOAD_OPTS, content['url'])
+                tracks = [Track.from_entry(e) for e in info['entries'] if e]
                 state.queue.extend(tracks)
+                state.notify()
                 await ctx.send(embed=discord.Embed(description=f"✅ Loaded **{len(tracks)}**. Rest loading in BG...", color=COLOR_MAIN), silent=True)
-                asyncio.create_task(self.load_rest_of_playlist(content['url'], ctx.guild.id))
+                self.spawn(self.load_rest_of_playlist(content['url'], ctx.guild.id))
             except: await ctx.send(embed=discord.Embed(description="❌ Error loading.", color=discord.Color.red()), silent=True)
 
         if not ctx.voice_client:
@@ -1306,14 +1629,13 @@ class MusicBot(commands.Cog):
     async def delplaylist(self, ctx, name: str):
         if name in saved_playlists: 
             del saved_playlists[name]
-            save_json(PLAYLIST_FILE, saved_playlists)
+            save_playlists(self.bot.loop)
             await ctx.send(embed=discord.Embed(description=f"🗑️ Deleted **{name}**.", color=COLOR_MAIN), silent=True)
         else: await ctx.send(embed=discord.Embed(description="❌ Not found.", color=discord.Color.red()), silent=True)
 
     @commands.hybrid_command(name="cache")
     async def cache_list(self, ctx):
-        valid = [f for f in os.listdir(CACHE_DIR) if f.endswith('.webm')]
-        data = [{'title': cache_map.get(f.replace('.webm',''), f), 'duration': 'Cached'} for f in valid]
+        data = [{'title': cache_map.get(vid, f"{vid}.webm"), 'duration': 'Cached'} for vid in cache_index.ids()]
         if not data: return await ctx.send(embed=discord.Embed(description="Cache empty.", color=COLOR_MAIN), silent=True)
         data.sort(key=lambda x: x['title'])
         view = ListPaginator(data, title="Local Cache", is_queue=False)
@@ -1321,12 +1643,10 @@ class MusicBot(commands.Cog):
 
     @commands.hybrid_command(name="dash")
     async def dash(self, ctx):
-        cpu = psutil.cpu_percent()
-        ram = psutil.virtual_memory().percent
-        try: temp = os.popen("vcgencmd measure_temp").readline().replace("temp=","").strip()
-        except: temp = "N/A"
-        count = len([n for n in os.listdir(CACHE_DIR) if n.endswith('.webm')])
-        size = sum(os.path.getsize(os.path.join(CACHE_DIR, f)) for f in os.listdir(CACHE_DIR) if f.endswith('.webm')) / (1024**3)
+        cpu, ram, temp_c = system_stats()
+        temp = f"{temp_c:.1f}'C" if temp_c is not None else "N/A"
+        count, size_bytes = cache_stats()
+        size = size_bytes / (1024**3)
         embed = discord.Embed(title="🚀 Pi Stats", color=COLOR_MAIN)
         embed.add_field(name="System", value=f"CPU: `{cpu}%` | RAM: `{ram}%` | {temp}")
         embed.add_field(name="Storage", value=f"`{count}` songs | `{size:.2f} GB` / {MAX_CACHE_SIZE_GB} GB")
@@ -1335,9 +1655,10 @@ class MusicBot(commands.Cog):
     @commands.hybrid_command(name="search")
     async def search(self, ctx, *, query: str):
         await ctx.defer()
-        info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_FLAT_OPTS).extract_info(f"ytsearch5:{query}", download=False))
+        info = await extract_search(self.bot.loop, YDL_FLAT_OPTS, f"ytsearch5:{query}")
         if not info.get('entries'): return await ctx.send("❌ No results.", silent=True)
         view = SelectionView(info['entries'], self, ctx)
+        if not view.children: return await ctx.send("❌ No results.", silent=True)
         view.message = await ctx.send("🔎 **Results:**", view=view, silent=True)
 
     @commands.hybrid_command(name="history")
@@ -1386,8 +1707,11 @@ class MusicBot(commands.Cog):
         seed_song = None
         if search:
             try:
-                q = search if re.match(r'^https?://', search) else f"ytsearch1:{search}"
-                info = await self.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_FLAT_OPTS).extract_info(q, download=False))
+                q = search if search.startswith(URL_PREFIXES) else f"ytsearch1:{search}"
+                if q.startswith('ytsearch'):
+                    info = await extract_search(self.bot.loop, YDL_FLAT_OPTS, q)
+                else:
+                    info = await ydl_extract(self.bot.loop, YDL_FLAT_OPTS, q)
                 e = info['entries'][0] if 'entries' in info else info
                 seed_song = {
                     'id': e['id'], 
@@ -1403,7 +1727,7 @@ class MusicBot(commands.Cog):
             if state.current_track:
                 seed_song = state.current_track
             else:
-                valid_cached = [f.replace('.webm', '') for f in os.listdir(CACHE_DIR) if f.endswith('.webm')]
+                valid_cached = cache_index.ids()
                 if valid_cached:
                     vid_id = random.choice(valid_cached)
                     seed_song = {'id': vid_id, 'title': cache_map.get(vid_id, 'Unknown'), 'author': 'Unknown'}
@@ -1425,8 +1749,9 @@ class MusicBot(commands.Cog):
         state.game = GuessGame(self, None, seed_song=seed_song, mode=mode)
         
         # CLEAR QUEUE AND STOP PLAYBACK
-        state.queue = []
+        state.queue.clear()
         state.current_track = None
+        state.notify()
         if guild.voice_client and guild.voice_client.is_playing():
             guild.voice_client.stop()
         
@@ -1460,6 +1785,7 @@ class MusicBot(commands.Cog):
     async def autoplay(self, ctx):
         state = self.get_state(ctx.guild.id)
         state.autoplay = not state.autoplay
+        state.notify()
         await self.ensure_autoplay(ctx.guild.id)
         
         if state.autoplay and state.queue and ctx.guild.voice_client and not ctx.guild.voice_client.is_playing():
@@ -1507,11 +1833,18 @@ async def main():
     try:
         async with bot:
             await bot.add_cog(MusicBot(bot))
+            # Run new tasks synchronously up to their first real await (3.12+). Installed only after the
+            # cog is built, so the loops it starts in __init__ don't run against a half-initialised cog.
+            if sys.version_info >= (3, 12):
+                asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
             await bot.start(TOKEN)
     except KeyboardInterrupt: pass
     finally:
         if not bot.is_closed(): await bot.close()
+        flush_pending_saves()
+        cache_index.sync_mtimes()
         log_info("👋 Bot Shutdown.")
+        log_listener.stop()
 
 if __name__ == "__main__":
     try:
@@ -1,4 +1,5 @@
 import os
+import shutil
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +12,16 @@ CACHE_MAP_FILE = 'cache_map.json'
 PLAYLIST_FILE = 'playlists.json'
 SETTINGS_FILE = 'server_settings.json'
 MAX_CACHE_SIZE_GB = 16
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 2))  # Parallel background downloads (keep low on SD cards)
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', 4))  # Dedicated yt-dlp metadata extraction threads (mostly network wait)
+
+# Auto-disconnect
+IDLE_TIMEOUT = 300  # seconds without playback before leaving the voice channel
+ALONE_GRACE = 60  # seconds to wait for someone to rejoin before leaving an empty channel
+
+# Search result cache (repeat searches skip yt-dlp)
+SEARCH_CACHE_TTL = 300  # seconds
+SEARCH_CACHE_SIZE = 128
 
 # Audio Settings
 COLOR_MAIN = 0xFFD700  # Gold
@@ -32,14 +43,31 @@ COMMON_YDL_ARGS = {
     'socket_timeout': 30
 }
 
+# Skip manifests we never use; metadata-only lookups don't need any stream manifests
+YT_METADATA_ARGS = {
+    'extractor_args': {'youtube': {'skip': ['dash', 'hls', 'translated_subs']}},
+    'youtube_include_dash_manifest': False
+}
+
+# Flat listings only read titles/ids, so the player pages can be skipped too. Not for single videos:
+# their extraction goes through the player response, which needs the webpage/configs on some videos.
+YT_FLAT_ARGS = {
+    **YT_METADATA_ARGS,
+    'extractor_args': {'youtube': {'skip': ['dash', 'hls', 'translated_subs'], 'player_skip': ['webpage', 'configs']}}
+}
+
 YDL_PLAY_OPTS = {
     'format': 'bestaudio[ext=webm]/bestaudio/best',
+    # Playback needs a real audio URL, so keep HLS as a fallback
+    'extractor_args': {'youtube': {'skip': ['dash', 'translated_subs']}},
+    'youtube_include_dash_manifest': False,
     **COMMON_YDL_ARGS
 }
 
 YDL_SINGLE_OPTS = {
     'extract_flat': 'in_playlist',
     'playlist_items': '1', # Only get first item if it forces a list
+    **YT_METADATA_ARGS,
     **COMMON_YDL_ARGS,
     'noplaylist': True # Critical change
 }
@@ -47,6 +75,7 @@ YDL_SINGLE_OPTS = {
 YDL_FLAT_OPTS = {
     'extract_flat': 'in_playlist',
     'playlist_items': '1-100',
+    **YT_FLAT_ARGS,
     **COMMON_YDL_ARGS,
     'noplaylist': False
 }
@@ -59,6 +88,7 @@ YDL_SEARCH_OPTS = {
 YDL_MIX_OPTS = {
     'extract_flat': 'in_playlist',
     'playlist_items': '1-20',
+    **YT_FLAT_ARGS,
     **COMMON_YDL_ARGS,
     'noplaylist': False
 }
@@ -68,12 +98,32 @@ YDL_DOWNLOAD_OPTS = {
     'outtmpl': f'{CACHE_DIR}/%(id)s.%(ext)s',
     'writethumbnail': True,
     'postprocessors': [{'key': 'FFmpegThumbnailsConvertor', 'format': 'jpg'}],
+    # Downscale to mqdefault size (320x180) and recompress; the dashboard never needs more
+    'postprocessor_args': {'thumbnailsconvertor+ffmpeg_o': ['-vf', 'scale=320:-2', '-q:v', '7']},
     **COMMON_YDL_ARGS
 }
 
+# Cache downloads are bound by per-connection throughput to googlevideo, not CPU: let aria2c split them when installed
+if shutil.which('aria2c'):
+    YDL_DOWNLOAD_OPTS['external_downloader'] = {'default': 'aria2c'}
+    YDL_DOWNLOAD_OPTS['external_downloader_args'] = {'aria2c': ['-x', '6', '-k', '1M', '--file-allocation=none']}
+
 YDL_PLAYLIST_LOAD_OPTS = {
     'extract_flat': 'in_playlist',
     'playlist_items': '1-50',
     **COMMON_YDL_ARGS,
     'noplaylist': False
 }
+
+YDL_PLAYLIST_REST_OPTS = {
+    'extract_flat': 'in_playlist',
+    'playlist_items': '51-',
+    **COMMON_YDL_ARGS,
+    'noplaylist': False
+}
+
+# Title-only lookup used when saving a playlist
+YDL_PLAYLIST_INFO_OPTS = {
+    'extract_flat': True,
+    'quiet': True
+}
@@ -1,19 +1,44 @@
-import json
 import logging
+import logging.handlers
 import os
+import queue
+import re
 import sys
+import threading
+import time
 import asyncio
-from config import CACHE_DIR, CACHE_MAP_FILE, MAX_CACHE_SIZE_GB, PLAYLIST_FILE, SETTINGS_FILE
+import atexit
+import concurrent.futures
+from collections import OrderedDict
+
+import orjson
+import psutil
+import yt_dlp
+
+from config import (
+    CACHE_DIR, CACHE_MAP_FILE, EXTRACT_WORKERS, MAX_CACHE_SIZE_GB, PLAYLIST_FILE, SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL,
+    SETTINGS_FILE
+)
+
+# Shared URL handling for Discord commands and the web API
+URL_PREFIXES = ('http://', 'https://') # for str.startswith; cheaper than a regex for a fixed prefix
+LIST_PARAM_RE = re.compile(r'([&?])list=[^&]*')
 
 # --- Logging Setup ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler("bot_logs.txt", mode='w', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
+# Records are handed to a background thread so the event loop never blocks on SD card writes.
+_log_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s')
+_log_file_handler = logging.handlers.RotatingFileHandler(
+    "bot_logs.txt", maxBytes=5 * 1024 * 1024, backupCount=2, encoding='utf-8'
 )
+_log_stream_handler = logging.StreamHandler(sys.stdout)
+for _h in (_log_file_handler, _log_stream_handler):
+    _h.setFormatter(_log_formatter)
+
+_log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(_log_queue, _log_file_handler, _log_stream_handler)
+log_listener.start()
+
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.handlers.QueueHandler(_log_queue)])
 
 def log_error(msg): logging.error(msg)
 def log_info(msg): logging.info(msg)
@@ -22,25 +47,160 @@ def load_json(filename):
     """Safely loads a JSON file."""
     if os.path.exists(filename):
         try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, OSError):
+            with open(filename, 'rb', buffering=65536) as f:
+                return orjson.loads(f.read())
+        except (orjson.JSONDecodeError, OSError):
             return {}
     return {}
 
+def _write_file(filename, payload):
+    """Writes via a temp file and rename, so a crash mid-write never leaves a truncated file."""
+    tmp = f"{filename}.tmp"
+    try:
+        with open(tmp, 'wb', buffering=65536) as f:
+            f.write(payload)
+        os.replace(tmp, filename)
+    except OSError as e:
+        log_error(f"Failed to save JSON to {filename}: {e}")
+
 def save_json(filename, data):
     """Safely saves data to a JSON file."""
     try:
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
-    except OSError as e:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    except TypeError as e:
         log_error(f"Failed to save JSON to {filename}: {e}")
+        return
+    _write_file(filename, payload)
+
+# filename -> (TimerHandle, data) for writes waiting to be coalesced
+_pending_saves = {}
+# Deferred writes run here, off the event loop; a single thread keeps writes to a file in order
+_save_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="save")
+
+def save_json_later(loop, filename, data, delay=1.0):
+    """Schedules a save; repeated calls within `delay` collapse into one write. Thread-safe."""
+    def schedule():
+        if filename not in _pending_saves:
+            _pending_saves[filename] = (loop.call_later(delay, _flush_save, filename), data)
+    loop.call_soon_threadsafe(schedule)
+
+def _flush_save(filename):
+    """Serializes a pending save (on the loop, so the data can't change mid-dump) and queues the write."""
+    _, data = _pending_saves.pop(filename)
+    try:
+        payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    except TypeError as e:
+        log_error(f"Failed to save JSON to {filename}: {e}")
+        return None
+    try:
+        return _save_pool.submit(_write_file, filename, payload)
+    except RuntimeError: # Executor already shut down (interpreter exit)
+        _write_file(filename, payload)
+        return None
+
+def flush_pending_saves():
+    """Writes out every pending coalesced save immediately and waits for them (used on shutdown)."""
+    futures = []
+    for filename in list(_pending_saves):
+        handle, _ = _pending_saves[filename]
+        handle.cancel()
+        futures.append(_flush_save(filename))
+    for fut in futures:
+        if fut: fut.result()
+
+# Last resort for exits that skip main()'s cleanup
+atexit.register(flush_pending_saves)
 
 # Load Initial State
 cache_map = load_json(CACHE_MAP_FILE)
 saved_playlists = load_json(PLAYLIST_FILE)
 server_settings = load_json(SETTINGS_FILE)
 
+_playlists_version = 0
+
+def save_playlists(loop):
+    """Records a change to saved_playlists and schedules the coalesced write."""
+    global _playlists_version
+    _playlists_version += 1
+    save_json_later(loop, PLAYLIST_FILE, saved_playlists, delay=0.5)
+
+def playlists_version():
+    """Counter bumped by every save_playlists(); lets the dashboard skip unchanged playlist lists."""
+    return _playlists_version
+
+# One YoutubeDL per option set per thread: construction (extractor setup, option parsing)
+# is paid once per executor thread instead of on every call, and no instance is shared
+# between threads, so no locking is needed.
+_ydl_local = threading.local()
+
+def get_ydl(opts):
+    """Returns a reusable YoutubeDL for `opts`, which must be a module-level constant."""
+    instances = getattr(_ydl_local, 'instances', None)
+    if instances is None:
+        instances = _ydl_local.instances = {}
+    ydl = instances.get(id(opts))
+    if ydl is None:
+        ydl = instances[id(opts)] = yt_dlp.YoutubeDL(opts)
+    return ydl
+
+# Extractions get their own small pool so they never starve the default executor
+# (file I/O, cache eviction) that the web dashboard and playback rely on.
+ydl_pool = concurrent.futures.ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="ydl")
+# Low priority work (rest of a playlist, autoplay mixes, game pool refills) queues on a single
+# thread of its own, so a long playlist load can never hold the slots /play and /search need.
+ydl_background_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ydl-bg")
+
+# (id(opts), url) -> in-flight extraction, shared by identical requests that overlap
+_inflight = {}
+
+def ydl_extract(loop, opts, url, background=False):
+    """Schedules extract_info(url) on the extraction pool; returns an awaitable.
+    Concurrent calls for the same url and options share one extraction."""
+    key = (id(opts), url)
+    fut = _inflight.get(key)
+    if fut is None:
+        pool = ydl_background_pool if background else ydl_pool
+        fut = _inflight[key] = loop.run_in_executor(pool, lambda: get_ydl(opts).extract_info(url, download=False))
+        fut.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded so one caller being cancelled doesn't cancel the result for the others
+    return asyncio.shield(fut)
+
+# (id(opts), query) -> (timestamp, info), least recently used first
+_search_cache = OrderedDict()
+
+async def extract_search(loop, opts, query):
+    """Runs a ytsearch extraction, answering repeats from a small TTL + LRU cache."""
+    key = (id(opts), query.lower())
+    hit = _search_cache.get(key)
+    if hit and time.time() - hit[0] < SEARCH_CACHE_TTL:
+        _search_cache.move_to_end(key)
+        return hit[1]
+
+    info = await ydl_extract(loop, opts, query)
+    _search_cache[key] = (time.time(), info)
+    _search_cache.move_to_end(key)
+    while len(_search_cache) > SEARCH_CACHE_SIZE:
+        _search_cache.popitem(last=False)
+    return info
+
+_THERMAL_ZONE = "/sys/class/thermal/thermal_zone0/temp"
+_SYS_STATS_TTL = 5
+_sys_stats = (0.0, None)
+
+def system_stats():
+    """Returns (cpu %, ram %, temp C or None), resampled at most every few seconds."""
+    global _sys_stats
+    now = time.monotonic()
+    if _sys_stats[1] is not None and now - _sys_stats[0] < _SYS_STATS_TTL:
+        return _sys_stats[1]
+
+    try:
+        with open(_THERMAL_ZONE) as f: temp = int(f.read()) / 1000.0
+    except (OSError, ValueError):
+        temp = None
+    _sys_stats = (now, (psutil.cpu_percent(), psutil.virtual_memory().percent, temp))
+    return _sys_stats[1]
+
 def format_time(seconds):
     """Formats seconds into MM:SS or HH:MM:SS."""
     if not seconds:
@@ -52,50 +212,177 @@ def format_time(seconds):
         return f"{h}:{m:02}:{s:02}"
     return f"{m}:{s:02}"
 
+class Track:
+    """A queued song. Slotted to keep long playlists small in memory; also readable like the
+    dicts it replaced (track['title'], track.get('suggested')) so older call sites keep working."""
+    __slots__ = ('id', 'title', 'author', 'duration', 'duration_seconds', 'webpage', 'suggested')
+    SAVED_FIELDS = ('id', 'title', 'author', 'duration', 'duration_seconds', 'webpage')
+
+    def __init__(self, id, title, author='Unknown', duration_seconds=0, webpage=None, suggested=False, duration=None):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.duration_seconds = duration_seconds
+        self.duration = duration if duration is not None else format_time(duration_seconds)
+        self.webpage = webpage or f"https://www.youtube.com/watch?v={id}"
+        self.suggested = suggested
+
+    @classmethod
+    def from_entry(cls, e, suggested=False):
+        """Builds a Track from a yt-dlp info dict or flat playlist entry."""
+        return cls(e['id'], e['title'], e.get('uploader') or 'Unknown', e.get('duration') or 0,
+                   e.get('webpage_url') or e.get('url'), suggested)
+
+    @classmethod
+    def from_dict(cls, d):
+        """Builds a Track from a saved playlist record."""
+        return cls(d['id'], d['title'], d.get('author', 'Unknown'), d.get('duration_seconds') or 0,
+                   d.get('webpage'), d.get('suggested', False), d.get('duration'))
+
+    def to_dict(self):
+        """Returns the record stored in playlists.json."""
+        return {f: getattr(self, f) for f in self.SAVED_FIELDS}
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+class CacheIndex:
+    """In-memory LRU view of the audio cache: video id -> [size_bytes, mtime], oldest first."""
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.total_size = 0
+        self.lock = threading.Lock()
+        self.touched = set() # Played since the last sync_mtimes(); on-disk mtime lags behind
+
+    def scan(self):
+        """Builds the index with a single pass over the cache directory."""
+        found = {}
+        untracked = 0
+        with os.scandir(CACHE_DIR) as it:
+            for entry in it:
+                # d_type answers is_file() without a syscall; the lstat below is the only one per file
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                st = entry.stat(follow_symlinks=False)
+                vid, ext = os.path.splitext(entry.name)
+                if ext == '.webm':
+                    rec = found.setdefault(vid, [0, 0])
+                    rec[0] += st.st_size
+                    rec[1] = st.st_mtime
+                elif ext == '.jpg':
+                    found.setdefault(vid, [0, 0])[0] += st.st_size
+                else:
+                    untracked += st.st_size
+
+        with self.lock:
+            self.entries.clear()
+            self.total_size = untracked
+            for vid, rec in sorted(found.items(), key=lambda x: x[1][1]):
+                if not rec[1]:
+                    # Thumbnail without audio, count it but never treat it as a track
+                    self.total_size += rec[0]
+                    continue
+                self.entries[vid] = rec
+                self.total_size += rec[0]
+
+    def add(self, vid):
+        """Registers a freshly downloaded track (audio + thumbnail) as most recently used."""
+        size, mtime = 0, 0
+        for ext in ('.webm', '.jpg'):
+            try:
+                st = os.stat(f"{CACHE_DIR}/{vid}{ext}")
+            except OSError:
+                continue
+            size += st.st_size
+            if ext == '.webm':
+                mtime = st.st_mtime
+        if not mtime:
+            return
+        with self.lock:
+            old = self.entries.pop(vid, None)
+            if old:
+                self.total_size -= old[0]
+            self.entries[vid] = [size, mtime]
+            self.total_size += size
+
+    def __contains__(self, vid):
+        with self.lock:
+            return vid in self.entries
+
+    def touch(self, vid):
+        """Marks a cached track as just played. Only the index is updated; see sync_mtimes()."""
+        with self.lock:
+            rec = self.entries.get(vid)
+            if rec:
+                rec[1] = time.time()
+                self.entries.move_to_end(vid)
+                self.touched.add(vid)
+
+    def sync_mtimes(self):
+        """Writes the play times recorded by touch() to the files, so the LRU order survives a restart."""
+        with self.lock:
+            pending = [(vid, self.entries[vid][1]) for vid in self.touched if vid in self.entries]
+            self.touched.clear()
+        for vid, mtime in pending:
+            try:
+                os.utime(f"{CACHE_DIR}/{vid}.webm", (mtime, mtime))
+            except OSError:
+                pass
+
+    def stats(self):
+        """Returns (track_count, total_bytes) without touching the disk."""
+        return len(self.entries), self.total_size
+
+    def ids(self):
+        """Returns a snapshot of the cached video ids, least recently played first."""
+        with self.lock:
+            return list(self.entries)
+
+    def pop_oldest(self, target_bytes):
+        """Removes least recently used entries from the index until it fits into target_bytes."""
+        victims = []
+        with self.lock:
+            while self.total_size > target_bytes and self.entries:
+                vid, (size, _) = self.entries.popitem(last=False)
+                self.total_size -= size
+                victims.append(vid)
+        return victims
+
+cache_index = CacheIndex()
+cache_stats = cache_index.stats
+MAX_CACHE_BYTES = MAX_CACHE_SIZE_GB * 1024 * 1024 * 1024
+
 def _enforce_cache_limit_sync():
-    """Deletes old cached files if the directory exceeds the size limit (Synchronous)."""
-    max_bytes = MAX_CACHE_SIZE_GB * 1024 * 1024 * 1024
-    files = []
-    total_size = 0
-    
-    # Scan directory for usage
-    with os.scandir(CACHE_DIR) as it:
-        for entry in it:
-            if entry.is_file():
-                total_size += entry.stat().st_size
-                if entry.name.endswith('.webm'):
-                    files.append(entry)
-    
-    if total_size > max_bytes:
-        # Sort by modification time (oldest first)
-        files.sort(key=lambda x: x.stat().st_mtime)
-        
-        for entry in files:
+    """Deletes the least recently played tracks if the cache exceeds the size limit (Synchronous).
+    Returns True if anything was evicted."""
+    if cache_index.total_size <= MAX_CACHE_BYTES:
+        return False
+
+    # Evict down to a buffer of 100MB below the limit
+    victims = cache_index.pop_oldest(MAX_CACHE_BYTES - 100 * 1024 * 1024)
+    for vid in victims:
+        for ext in ('.webm', '.jpg'):
             try:
-                os.remove(entry.path)
-                
-                # Try to remove associated thumbnail
-                thumb_path = entry.path.replace('.webm', '.jpg')
-                if os.path.exists(thumb_path):
-                    os.remove(thumb_path)
-                
-                total_size -= entry.stat().st_size
-                vid_id = entry.name.replace('.webm', '')
-                
-                if vid_id in cache_map:
-                    del cache_map[vid_id]
-                
-                # Stop if we are safely under the limit (buffer of 100MB)
-                if total_size <= (max_bytes - 100 * 1024 * 1024):
-                    break
+                os.remove(f"{CACHE_DIR}/{vid}{ext}")
+            except FileNotFoundError:
+                pass
             except OSError as e:
-                log_error(f"Error cleaning cache file {entry.name}: {e}")
-                
-        save_json(CACHE_MAP_FILE, cache_map)
+                log_error(f"Error cleaning cache file {vid}{ext}: {e}")
+        cache_map.pop(vid, None)
+
+    return bool(victims)
 
 async def enforce_cache_limit(loop):
-    """Async wrapper for cache limit enforcement."""
-    await loop.run_in_executor(None, _enforce_cache_limit_sync)
+    """Async wrapper for cache limit enforcement. Only leaves the event loop when over the limit."""
+    if cache_index.total_size > MAX_CACHE_BYTES:
+        if await loop.run_in_executor(None, _enforce_cache_limit_sync):
+            save_json_later(loop, CACHE_MAP_FILE, cache_map)
 
 def get_thumbnail_url(vid_id):
     """Returns local thumbnail path if cached, else remote URL."""
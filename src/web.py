@@ -1,31 +1,63 @@
 import asyncio
+import gzip
+import hashlib
+import hmac
 import logging
 import os
-import random
 import re
-import shutil
-import psutil
-from quart import Quart, jsonify, make_response, redirect, render_template, request, send_from_directory
-import yt_dlp
+from collections import deque
+import orjson
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HyperConfig
+from quart import Quart, Response, make_response, redirect, render_template, request, send_from_directory, websocket
 
 from config import (
-    CACHE_DIR, PLAYLIST_FILE, YDL_FLAT_OPTS, YDL_PLAYLIST_LOAD_OPTS, YDL_SINGLE_OPTS
+    CACHE_DIR, YDL_FLAT_OPTS, YDL_PLAYLIST_INFO_OPTS, YDL_PLAYLIST_LOAD_OPTS, YDL_SINGLE_OPTS
 )
 from utils import (
-    log_error, log_info, save_json, format_time, get_thumbnail_url, 
-    cache_map, saved_playlists
+    log_error, log_info, save_playlists, playlists_version, format_time, get_thumbnail_url, ydl_extract, extract_search,
+    cache_stats, system_stats, saved_playlists, Track, URL_PREFIXES, LIST_PARAM_RE
 )
 
 app = Quart(__name__, template_folder='templates')
 logging.getLogger('quart.serving').setLevel(logging.ERROR)
 logging.getLogger('hypercorn.error').setLevel(logging.ERROR)
 bot_instance = None 
+music_cog = None # Set by the MusicBot cog on load; every API request reads it
+
+STATUS_PUSH_FALLBACK = 1.0 # seconds between version checks when nothing notified
+
+def serve_dashboard(host='0.0.0.0', port=5000):
+    """Returns the coroutine serving the dashboard. Unlike app.run_task (meant for development),
+    this skips the per-request access log line, which the 1s status polling would otherwise pay for."""
+    config = HyperConfig()
+    config.bind = [f"{host}:{port}"]
+    config.accesslog = None
+    config.errorlog = app.logger
+    config.keep_alive_timeout = 30 # Outlive the polling interval so tabs reuse one connection
+    config.backlog = 16 # A handful of dashboard tabs, not a public site; keeps a connection burst small on the Pi
+    return serve(app, config)
+
+def _json(obj, status=200):
+    """jsonify replacement backed by orjson (C encoder; the status poll is the hottest route)."""
+    return Response(orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS), status=status, content_type='application/json')
+
+class WebCtx:
+    """Minimal stand-in for a commands.Context so dashboard actions can drive play_next."""
+    __slots__ = ('guild', 'voice_client', 'author')
+
+    def __init__(self, guild, voice_client):
+        self.guild = guild
+        self.voice_client = voice_client
+        self.author = "WebUser"
+
+    async def send(self, *args, **kwargs): pass
 
 # --- Auth Helpers ---
 def get_bot_cog():
     """Reliably retrieves the MusicBot cog instance."""
-    if 'BOT_COG' in app.config:
-        return app.config['BOT_COG']
+    if music_cog:
+        return music_cog
     # Fallback to global search
     if bot_instance:
         return bot_instance.get_cog('MusicBot')
@@ -48,6 +80,24 @@ def get_bot_token():
         return cog.web_auth_token
     return None
 
+# Reachable without the auth cookie
+_PUBLIC_PREFIXES = ('/auth', '/cache', '/health', '/static/', '/favicon.ico')
+
+_DENIED_BODY = """
+    <body style="background:#0f0f0f; color:#eee; font-family:sans-serif; display:flex; flex-direction:column; align-items:center; justify-content:center; height:100vh; margin:0;">
+        <h1 style="color:#ff4444; font-size:4rem; margin:0;">NO ACCESS</h1>
+        <h2 style="margin-top:10px;">Access Denied</h2>
+        <p style="color:#888;">Use <code>/link</code> in Discord to generate a secure key.</p>
+    </body>
+""".encode('utf-8')
+
+def token_ok(candidate):
+    """Constant-time check of a cookie/URL token against the bot's web token."""
+    server_token = get_bot_token()
+    if not server_token or not candidate:
+        return False
+    return hmac.compare_digest(candidate.encode(), server_token.encode())
+
 def get_target_guild(guild_id=None):
     """Returns the target guild based on URL param, cookie, or fallback."""
     cog = get_bot_cog()
@@ -70,37 +120,26 @@ def get_target_guild(guild_id=None):
         
     return get_first_available_guild()
 
-def set_bot_instance(bot):
-    global bot_instance
+def set_bot_instance(bot, cog=None):
+    global bot_instance, music_cog
     bot_instance = bot
+    music_cog = cog
 
 # --- Routes ---
 
 @app.before_request
 def check_auth():
-    if request.path.startswith('/auth') or request.path.startswith('/cache') or request.path.startswith('/health'):
+    if request.path.startswith(_PUBLIC_PREFIXES):
         return
     
-    user_token = request.cookies.get('pi_music_auth')
-    server_token = get_bot_token()
-    
-    if not server_token or user_token != server_token:
-        html = """
-            <body style="background:#0f0f0f; color:#eee; font-family:sans-serif; display:flex; flex-direction:column; align-items:center; justify-content:center; height:100vh; margin:0;">
-                <h1 style="color:#ff4444; font-size:4rem; margin:0;">NO ACCESS</h1>
-                <h2 style="margin-top:10px;">Access Denied</h2>
-                <p style="color:#888;">Use <code>/link</code> in Discord to generate a secure key.</p>
-            </body>
-        """
-        return html, 403
+    if not token_ok(request.cookies.get('pi_music_auth')):
+        return Response(_DENIED_BODY, status=403, content_type='text/html; charset=utf-8')
 
 @app.route('/auth')
 async def auth_route():
     token_from_url = request.args.get('token')
     guild_id = request.args.get('guild')
-    server_token = get_bot_token()
-    
-    if token_from_url == server_token:
+    if token_ok(token_from_url):
         resp = await make_response(redirect(f'/dashboard/{guild_id}' if guild_id else '/'))
         # Using Lax SameSite policy to allow cookie to set during redirect
         resp.set_cookie('pi_music_auth', token_from_url, max_age=86400, samesite='Lax')
@@ -108,12 +147,15 @@ async def auth_route():
             resp.set_cookie('pi_music_guild_id', guild_id, max_age=86400, samesite='Lax')
         return resp
     
-    log_error(f"Auth Failed. URL Token: {token_from_url}, Server Token: {server_token}")
+    log_error(f"Auth Failed. URL Token: {token_from_url}")
     return "❌ Invalid Token.", 403
 
 @app.route('/cache/thumb/<path:filename>')
 async def serve_thumbnail(filename):
-    return await send_from_directory(os.path.abspath(CACHE_DIR), filename)
+    resp = await send_from_directory(os.path.abspath(CACHE_DIR), filename)
+    # Thumbnails are keyed by video id and never change once written
+    resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
 
 @app.route('/health')
 async def health_check():
@@ -131,6 +173,17 @@ async def home_redirect():
     
     return "❌ No server found. Use /link in Discord.", 404
 
+_STYLE_BLOCK_RE = re.compile(r'(<style[^>]*>)(.*?)(</style>)', re.S)
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+
+def _minify_html(html):
+    """Drop indentation, blank lines, CSS comments and whole-line // comments. Newlines stay so JS keeps its semicolon insertion."""
+    html = _STYLE_BLOCK_RE.sub(lambda m: m.group(1) + _CSS_COMMENT_RE.sub('', m.group(2)) + m.group(3), html)
+    lines = (line.strip() for line in html.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//'))
+
+_dashboard_pages = {} # (guild_id, bot_name) -> ((bytes, etag, encoding) plain, same gzipped)
+
 @app.route('/dashboard/<int:guild_id>')
 async def dashboard(guild_id):
     cog = get_bot_cog()
@@ -140,56 +193,36 @@ async def dashboard(guild_id):
     if not guild: return "❌ Bot is not in this server.", 404
     
     name = cog.bot.user.name if cog.bot.user else "MusicBot"
-    return await render_template('dashboard.html', bot_name=name, guild_id=guild_id)
+    # The page only depends on (guild, bot name); render once and serve the encoded bytes after that
+    key = (guild_id, name)
+    page = _dashboard_pages.get(key)
+    if page is None:
+        body = _minify_html(await render_template('dashboard.html', bot_name=name, guild_id=guild_id)).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()[:16]
+        # Each encoding is its own representation, so each gets its own strong ETag
+        page = _dashboard_pages[key] = (
+            (body, f'"{etag}"', None),
+            (gzip.compress(body, compresslevel=9), f'"{etag}-gz"', 'gzip')
+        )
+
+    data, etag, encoding = page[1] if 'gzip' in request.headers.get('Accept-Encoding', '') else page[0]
+    headers = {'Cache-Control': 'private, max-age=300', 'Vary': 'Accept-Encoding', 'ETag': etag}
+    if request.headers.get('If-None-Match') == etag:
+        return Response(b'', status=304, headers=headers)
+    if encoding: headers['Content-Encoding'] = encoding
+    return Response(data, content_type='text/html; charset=utf-8', headers=headers)
 
 import time
 
-# ... imports ...
-
-# Cache for sysinfo to reduce SD card IO
-_sysinfo_cache = {
-    'storage_bytes': 0,
-    'last_update': 0
-}
-
 @app.route('/api/sysinfo')
 async def api_sysinfo():
-    # CPU Usage
-    cpu_usage = psutil.cpu_percent()
-    
-    # RAM Usage
-    ram = psutil.virtual_memory()
-    ram_usage = ram.percent
-    
-    # Temperature (Linux/Pi)
-    temp = 0
-    try:
-        if os.path.exists("/sys/class/thermal/thermal_zone0/temp"):
-            with open("/sys/class/thermal/thermal_zone0/temp", "r") as f:
-                temp = int(f.read()) / 1000.0
-    except:
-        pass
-    
-    # Storage (Music Cache specific) - Cached 60s
-    global _sysinfo_cache
-    current_time = time.time()
+    # CPU / RAM / Temperature - sampled at most every few seconds, shared with /dash
+    cpu_usage, ram_usage, temp = system_stats()
+    if temp is None: temp = 0
     
+    # Storage (Music Cache specific) - read from the in-memory cache index, no disk scan
     try:
-        if current_time - _sysinfo_cache['last_update'] > 60:
-            if not os.path.exists(CACHE_DIR):
-                os.makedirs(CACHE_DIR, exist_ok=True)
-            
-            # Calculate total size of files in cache folder
-            total_used_bytes = 0
-            for f in os.listdir(CACHE_DIR):
-                fp = os.path.join(CACHE_DIR, f)
-                if os.path.isfile(fp):
-                    total_used_bytes += os.path.getsize(fp)
-            
-            _sysinfo_cache['storage_bytes'] = total_used_bytes
-            _sysinfo_cache['last_update'] = current_time
-            
-        total_used_bytes = _sysinfo_cache['storage_bytes']
+        _, total_used_bytes = cache_stats()
         
         used_gb = total_used_bytes / (1024**3)
         from config import MAX_CACHE_SIZE_GB
@@ -204,7 +237,7 @@ async def api_sysinfo():
         storage_display_total = 0
         storage_percent = 0
     
-    return jsonify({
+    return _json({
         'cpu': cpu_usage,
         'ram': ram_usage,
         'temp': round(temp, 1),
@@ -215,6 +248,62 @@ async def api_sysinfo():
 
 # --- API Routes ---
 
+def build_status(guild, state):
+    """The player state shown by the dashboard (shared by /api/status and the status websocket)."""
+    current = None
+    if state.current_track:
+        current = {
+            'title': state.current_track.title,
+            'author': state.current_track.author,
+            'duration': state.current_track.duration,
+            'thumbnail': get_thumbnail_url(state.current_track.id)
+        }
+    
+    queue_data = []
+    for t in state.queue:
+        queue_data.append({
+            'title': t.title,
+            'author': t.author,
+            'id': t.id,
+            'thumbnail': get_thumbnail_url(t.id),
+            'suggested': t.suggested
+        })
+        
+    return {'current': current, 'queue': queue_data, 'guild': guild.name, 'autoplay': state.autoplay}
+
+def status_bytes(guild, state, version):
+    """Serialized status for `version`; built once and shared by every poll and websocket until it changes."""
+    cached = state.status_cache
+    if cached and cached[0] == version:
+        return cached[1]
+    data = orjson.dumps({'v': version, **build_status(guild, state)})
+    state.status_cache = (version, data)
+    return data
+
+@app.websocket('/ws/<int:guild_id>/status')
+async def ws_status(guild_id):
+    """Pushes the status whenever it changes, replacing the dashboard's 1s polling."""
+    # A response returned before accept() rejects the handshake with that status
+    if not token_ok(websocket.cookies.get('pi_music_auth')):
+        return Response(_DENIED_BODY, status=403, content_type='text/html; charset=utf-8')
+
+    cog = get_bot_cog()
+    guild = cog.bot.get_guild(guild_id) if cog else None
+    if not guild: return Response('Guild not found', status=404)
+
+    last_version = None
+    while True:
+        state = cog.get_state(guild.id)
+        changed = state.changed
+        version = state.status_version()
+        if version != last_version:
+            await websocket.send(status_bytes(guild, state, version).decode())
+            last_version = version
+        # Woken by state.notify(); the timeout re-checks in case the guild's state was replaced
+        try: await asyncio.wait_for(changed.wait(), STATUS_PUSH_FALLBACK)
+        except asyncio.TimeoutError: pass
+        await asyncio.sleep(0.1) # Coalesce bursts (e.g. a playlist landing track by track)
+
 @app.route('/api/<int:guild_id>/status')
 async def api_status(guild_id):
     guild = get_target_guild(guild_id)
@@ -225,40 +314,42 @@ async def api_status(guild_id):
     elif not guild: log_error(f"API Error: Bot is online but no guild found. Guilds len: {len(cog.bot.guilds) if cog and cog.bot else 'None'}")
     
     if not guild or not cog:
-        return jsonify({'current': None, 'queue': [], 'guild': None, 'autoplay': False})
+        return _json({'current': None, 'queue': [], 'guild': None, 'autoplay': False})
     
     state = cog.get_state(guild.id)
-    
-    current = None
-    if state.current_track:
-        current = {
-            'title': state.current_track['title'],
-            'author': state.current_track['author'],
-            'duration': state.current_track['duration'],
-            'thumbnail': get_thumbnail_url(state.current_track['id'])
-        }
-    
-    queue_data = []
-    for t in state.queue:
-        queue_data.append({
-            'title': t['title'],
-            'author': t.get('author', 'Unknown'),
-            'id': t['id'],
-            'thumbnail': get_thumbnail_url(t['id']),
-            'suggested': t.get('suggested', False)
-        })
-        
-    return jsonify({'current': current, 'queue': queue_data, 'guild': guild.name, 'autoplay': state.autoplay})
+    version = state.status_version()
+    pl_version = playlists_version()
+    
+    # Most polls see an unchanged state; let the browser reuse its copy
+    etag = f'"{guild.id}-{version}-{pl_version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304
+    
+    # Clients send back the versions they already have and only get the parts that changed
+    send_status = request.args.get('since', type=int) != version
+    if request.args.get('pv', type=int) != pl_version:
+        payload = {'v': version, 'pv': pl_version, 'playlists': playlist_summary()}
+        if send_status: payload.update(build_status(guild, state))
+        resp = _json(payload)
+    elif send_status:
+        resp = Response(status_bytes(guild, state, version), content_type='application/json')
+    else:
+        resp = _json({'v': version})
+    resp.headers['ETag'] = etag
+    return resp
 
-@app.route('/api/<int:guild_id>/playlists', methods=['GET'])
-async def api_get_playlists(guild_id):
+def playlist_summary():
     data = []
     for name, content in saved_playlists.items():
         if isinstance(content, list):
             data.append({'name': name, 'count': len(content), 'type': 'static'})
         elif isinstance(content, dict):
             data.append({'name': name, 'count': 0, 'type': 'live'})
-    return jsonify(data)
+    return data
+
+@app.route('/api/<int:guild_id>/playlists', methods=['GET'])
+async def api_get_playlists(guild_id):
+    return _json(playlist_summary())
 
 @app.route('/api/<int:guild_id>/playlists/save', methods=['POST'])
 async def api_save_playlist(guild_id):
@@ -267,21 +358,21 @@ async def api_save_playlist(guild_id):
     url = data.get('url', '')
     
     if not name:
-        return jsonify({'error': 'No name'}), 400
+        return _json({'error': 'No name'}, 400)
         
     if url:
         if 'youtube.com' not in url and 'youtu.be' not in url:
-             return jsonify({'error': 'Invalid YouTube URL'}), 400
+             return _json({'error': 'Invalid YouTube URL'}, 400)
              
         saved_playlists[name] = {'type': 'live', 'url': url}
-        save_json(PLAYLIST_FILE, saved_playlists)
-        return jsonify({'status': 'ok'})
+        save_playlists(asyncio.get_running_loop())
+        return _json({'status': 'ok'})
     
     # Save current queue
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
     if not guild or not cog:
-        return jsonify({'error': 'No guild'}), 400
+        return _json({'error': 'No guild'}, 400)
         
     state = cog.get_state(guild.id)
     
@@ -291,20 +382,13 @@ async def api_save_playlist(guild_id):
     tracks.extend(state.queue)
     
     if not tracks:
-        return jsonify({'error': 'Empty'}), 400
+        return _json({'error': 'Empty'}, 400)
     
-    clean = [{
-        'id': t['id'], 
-        'title': t['title'], 
-        'author': t['author'], 
-        'duration': t['duration'], 
-        'duration_seconds': t['duration_seconds'], 
-        'webpage': t['webpage']
-    } for t in tracks]
+    clean = [t.to_dict() for t in tracks]
     
     saved_playlists[name] = clean
-    save_json(PLAYLIST_FILE, saved_playlists)
-    return jsonify({'status': 'ok'})
+    save_playlists(asyncio.get_running_loop())
+    return _json({'status': 'ok'})
 
 @app.route('/api/<int:guild_id>/playlists/load', methods=['POST'])
 async def api_load_playlist(guild_id):
@@ -312,43 +396,37 @@ async def api_load_playlist(guild_id):
     name = data.get('name', '').lower()
     
     if name not in saved_playlists:
-        return jsonify({'error': 'Not found'}), 404
+        return _json({'error': 'Not found'}, 404)
         
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
     if not guild or not cog:
-        return jsonify({'error': 'No guild'}), 400
+        return _json({'error': 'No guild'}, 400)
         
     state = cog.get_state(guild.id)
     if state.game and state.game.active:
-        return jsonify({'error': 'Game is active! Cannot load playlist.'}), 400
+        return _json({'error': 'Game is active! Cannot load playlist.'}, 400)
 
     content = saved_playlists[name]
     new_tracks = []
     
     if isinstance(content, list):
-        new_tracks = content
+        new_tracks = [Track.from_dict(t) for t in content]
     elif isinstance(content, dict):
         try:
-            info = await cog.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_PLAYLIST_LOAD_OPTS).extract_info(content['url'], download=False))
+            info = await ydl_extract(cog.bot.loop, YDL_PLAYLIST_LOAD_OPTS, content['url'])
             if 'entries' in info:
                 for e in info['entries']:
                     if e:
-                        new_tracks.append({
-                            'id': e['id'], 
-                            'title': e['title'], 
-                            'author': e['uploader'], 
-                            'duration': format_time(e['duration']), 
-                            'duration_seconds': e['duration'], 
-                            'webpage': f"https://www.youtube.com/watch?v={e['id']}"
-                        })
-            asyncio.create_task(cog.load_rest_of_playlist(content['url'], guild.id))
+                        new_tracks.append(Track.from_entry(e))
+            cog.spawn(cog.load_rest_of_playlist(content['url'], guild.id))
         except Exception as e:
             log_error(f"Playlist load error: {e}")
-            return jsonify({'error': 'Fetch fail'}), 500
+            return _json({'error': 'Fetch fail'}, 500)
         
     if new_tracks:
         state.queue.extend(new_tracks)
+        state.notify()
         # Try to connect if not in VC
         if not guild.voice_client:
             for channel in guild.voice_channels:
@@ -357,39 +435,33 @@ async def api_load_playlist(guild_id):
                     break
 
         if guild.voice_client and not guild.voice_client.is_playing() and not state.processing_next:
-             class DummyCtx:
-                 def __init__(self, g, v):
-                     self.guild = g
-                     self.voice_client = v
-                     self.author = "WebUser"
-                 async def send(self, *args, **kwargs): pass 
-             
-             await cog.play_next(DummyCtx(guild, guild.voice_client))
-        return jsonify({'status': 'ok'})
+             # Resolving the first stream can take seconds; the dashboard sees playback start via the status push
+             cog.spawn(cog.play_next(WebCtx(guild, guild.voice_client)))
+        return _json({'status': 'ok', 'count': len(new_tracks)})
         
-    return jsonify({'error': 'Empty'}), 400
+    return _json({'error': 'Empty'}, 400)
 
 @app.route('/api/<int:guild_id>/playlists/delete', methods=['POST'])
 async def api_del_playlist(guild_id):
     data = await request.get_json()
     if data['name'] in saved_playlists:
         del saved_playlists[data['name']]
-        save_json(PLAYLIST_FILE, saved_playlists)
-    return jsonify({'status': 'ok'})
+        save_playlists(asyncio.get_running_loop())
+    return _json({'status': 'ok'})
 
 @app.route('/api/<int:guild_id>/search', methods=['POST'])
 async def api_search(guild_id):
     data = await request.get_json()
     cog = get_bot_cog()
-    if not cog: return jsonify([]), 500
+    if not cog: return _json([], 500)
     try:
-        info = await cog.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(YDL_FLAT_OPTS).extract_info(f"ytsearch5:{data['query']}", download=False))
+        info = await extract_search(cog.bot.loop, YDL_FLAT_OPTS, f"ytsearch5:{data['query']}")
         res = []
         if 'entries' in info:
             for e in info['entries']:
                 if e:
                     thumb = e.get('thumbnail')
-                    if not thumb or not thumb.startswith('http'):
+                    if not thumb or not thumb.startswith(URL_PREFIXES):
                         thumb = f"https://i.ytimg.com/vi/{e['id']}/mqdefault.jpg"
                     
                     res.append({
@@ -399,66 +471,62 @@ async def api_search(guild_id):
                         'url': f"https://www.youtube.com/watch?v={e['id']}", 
                         'thumbnail': thumb
                     })
-        return jsonify(res)
+        return _json(res)
     except Exception:
-        return jsonify([]), 500
+        return _json([], 500)
 
 @app.route('/api/<int:guild_id>/control/<action>', methods=['POST'])
 async def api_control(guild_id, action):
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
     if not guild or not cog:
-        return jsonify({'error': 'No guild'}), 400
+        return _json({'error': 'No guild'}, 400)
         
     vc = guild.voice_client
     state = cog.get_state(guild.id)
     
     if action == 'pause' and vc: 
         if vc.is_playing():
-            vc.pause() 
+            vc.pause()
+            cog.start_idle(guild.id)
         elif vc.is_paused():
             vc.resume()
     elif action == 'skip' and vc:
         vc.stop()
     elif action == 'clear':
         if state.autoplay:
-            state.queue = [t for t in state.queue if t.get('suggested')]
+            state.queue = deque(t for t in state.queue if t.suggested)
         else:
-            state.queue = []
+            state.queue.clear()
     elif action == 'shuffle':
-        user_queue = [t for t in state.queue if not t.get('suggested')]
-        suggested = [t for t in state.queue if t.get('suggested')]
-        random.shuffle(user_queue)
-        state.queue[:] = user_queue + suggested
+        state.shuffle()
+        cog.prefetch_next(guild.id)
     elif action == 'autoplay':
         state.autoplay = not state.autoplay
         await cog.ensure_autoplay(guild.id)
         if state.autoplay and state.queue and vc and not vc.is_playing():
-             class DummyCtx:
-                 def __init__(self, g, v):
-                     self.guild = g
-                     self.voice_client = v
-                     self.author = "WebUser"
-                 async def send(self, *args, **kwargs): pass 
-             await cog.play_next(DummyCtx(guild, vc))
+             await cog.play_next(WebCtx(guild, vc))
     elif action == 'regenerate':
         await cog.regenerate_autoplay(guild.id)
         
-    return jsonify({'status':'ok'})
+    state.notify()
+    return _json({'status':'ok'})
 
 @app.route('/api/<int:guild_id>/remove/<int:index>', methods=['POST'])
 async def api_remove(guild_id, index):
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
     if not guild or not cog:
-        return jsonify({'error': 'No guild'}), 400
+        return _json({'error': 'No guild'}, 400)
     
     state = cog.get_state(guild.id)
     if 0 <= index < len(state.queue):
-        if state.queue[index].get('suggested') and state.autoplay:
-            return jsonify({'error': 'Cannot remove autoplay suggestion'}), 400
+        if state.queue[index].suggested and state.autoplay:
+            return _json({'error': 'Cannot remove autoplay suggestion'}, 400)
         del state.queue[index]
-    return jsonify({'status': 'ok'})
+        state.notify()
+        if index == 0: cog.prefetch_next(guild.id)
+    return _json({'status': 'ok'})
 
 @app.route('/api/<int:guild_id>/add', methods=['POST'])
 async def api_add(guild_id):
@@ -466,31 +534,32 @@ async def api_add(guild_id):
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
     if not guild or not cog:
-        return jsonify({'error': 'No guild'}), 400
+        return _json({'error': 'No guild'}, 400)
     
     state = cog.get_state(guild.id)
     if state.game and state.game.active:
-        return jsonify({'error': 'Game is active! Cannot add songs.'}), 400
+        return _json({'error': 'Game is active! Cannot add songs.'}, 400)
 
     query = data['query']
     
     # Strip playlist if video is present
     if "v=" in query and "list=" in query:
-        query = re.sub(r'([&?])list=[^&]*', '', query)
+        query = LIST_PARAM_RE.sub('', query)
 
     mode = data.get('mode', 'song')
     is_playlist = (mode == 'playlist')
 
-    if not re.match(r'^https?://', query):
+    if not query.startswith(URL_PREFIXES):
         query = f"ytsearch1:{query}"
         is_playlist = False
     
     if not state.last_text_channel:
-        state.last_text_channel = guild.text_channels[0]
+        state.last_text_channel = cog.get_notification_channel(guild)
     
     # 1. Safer clear: Only remove the suggestion if it's at the end to make room
-    if state.queue and state.queue[-1].get('suggested'):
+    if state.queue and state.queue[-1].suggested:
         state.queue.pop()
+        state.notify()
 
     try:
         # Try to connect if not in VC
@@ -503,68 +572,55 @@ async def api_add(guild_id):
         if is_playlist:
              # Just fetch basic info first to get title
              try:
-                 info_temp = await cog.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL({'extract_flat': True, 'quiet': True}).extract_info(query, download=False))
+                 info_temp = await ydl_extract(cog.bot.loop, YDL_PLAYLIST_INFO_OPTS, query)
                  title = info_temp.get('title', 'Unknown Playlist')
                  safe_title = "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).strip()
                  if not safe_title: safe_title = f"Playlist-{int(time.time())}"
                  saved_playlists[safe_title] = {'type': 'live', 'url': query}
-                 save_json(PLAYLIST_FILE, saved_playlists)
+                 save_playlists(asyncio.get_running_loop())
              except: pass
 
         # Select Options
         opts = YDL_SINGLE_OPTS if (not is_playlist and 'ytsearch' not in query) else YDL_FLAT_OPTS
         
         # Use Flat Options (verified working)
-        info = await cog.bot.loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(opts).extract_info(query, download=False))
+        if 'ytsearch' in query:
+            info = await extract_search(cog.bot.loop, opts, query)
+        else:
+            info = await ydl_extract(cog.bot.loop, opts, query)
         
         # 2. Safer clear: Re-check after await
-        if state.queue and state.queue[-1].get('suggested'):
+        if state.queue and state.queue[-1].suggested:
             state.queue.pop()
+            state.notify()
 
-        def process(e): 
-            url = e.get('webpage_url') or e.get('url') or f"https://www.youtube.com/watch?v={e['id']}"
-            return {
-                'id': e['id'], 
-                'title': e['title'], 
-                'author': e.get('uploader', 'Unknown'), 
-                'duration': format_time(e.get('duration', 0)), 
-                'duration_seconds': e.get('duration', 0), 
-                'webpage': url
-            }
-        
         tracks = []
         if 'entries' in info:
-            tracks = [process(e) for e in info['entries'] if e]
+            tracks = [Track.from_entry(e) for e in info['entries'] if e]
         else:
-            tracks = [process(info)]
+            tracks = [Track.from_entry(info)]
             
-        if not tracks: return jsonify({'error': 'No tracks found'}), 404
+        if not tracks: return _json({'error': 'No tracks found'}, 404)
 
         state.queue.extend(tracks)
+        state.notify()
         
         # Ensure autoplay suggestion is at the end
-        cog.bot.loop.create_task(cog.ensure_autoplay(guild.id, force=True))
+        cog.spawn(cog.ensure_autoplay(guild.id, force=True))
 
         if guild.voice_client and not guild.voice_client.is_playing() and not state.processing_next:
-             class DummyCtx:
-                 def __init__(self, g, v):
-                     self.guild = g
-                     self.voice_client = v
-                     self.author = "WebUser"
-                 async def send(self, *args, **kwargs): pass 
-             
-             await cog.play_next(DummyCtx(guild, guild.voice_client))
+             await cog.play_next(WebCtx(guild, guild.voice_client))
 
-        return jsonify({'status':'ok', 'count': len(tracks), 'playlist_saved': is_playlist})
+        return _json({'status':'ok', 'count': len(tracks), 'playlist_saved': is_playlist})
     except Exception as e:
         log_error(f"API Add Error: {e}")
-        return jsonify({'error':'fail'}), 500
+        return _json({'error':'fail'}, 500)
 
 @app.route('/api/<int:guild_id>/game/status')
 async def api_game_status(guild_id):
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
-    if not guild or not cog: return jsonify({'active': False})
+    if not guild or not cog: return _json({'active': False})
     
     state = cog.get_state(guild.id)
     
@@ -575,7 +631,7 @@ async def api_game_status(guild_id):
             vcs.append({'id': str(vc.id), 'name': vc.name})
             
     if not state.game or not state.game.active:
-        return jsonify({'active': False, 'channels': vcs})
+        return _json({'active': False, 'channels': vcs})
         
     g = state.game
     # Clean scores for JSON
@@ -594,14 +650,14 @@ async def api_game_status(guild_id):
         
     scores.sort(key=lambda x: x['score'], reverse=True)
     
-    return jsonify({
+    return _json({
         'active': True,
         'mode': g.mode,
         'round_duration': g.play_duration,
         'current_points': max(1, 10 - ((g.play_duration - 5) // 5) * 2),
         'scores': scores,
         'transitioning': g.transitioning,
-        'history': g.history,
+        'history': list(g.history),
         'last_reveal': g.last_reveal,
         'channel': g.ctx.channel.name if hasattr(g.ctx, 'channel') and g.ctx.channel else 'Unknown'
     })
@@ -612,18 +668,18 @@ async def api_game_guess(guild_id):
     guess = data.get('guess', '').strip()
     name = data.get('name', 'WebUser').strip()
     
-    if not guess: return jsonify({'error': 'Empty guess'}), 400
+    if not guess: return _json({'error': 'Empty guess'}, 400)
     
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
-    if not guild or not cog: return jsonify({'error': 'No guild'}), 400
+    if not guild or not cog: return _json({'error': 'No guild'}, 400)
     
     state = cog.get_state(guild.id)
     if not state.game or not state.game.active:
-        return jsonify({'error': 'No active game'}), 400
+        return _json({'error': 'No active game'}, 400)
         
     result = await state.game.process_web_guess(name, guess)
-    return jsonify({'correct': result})
+    return _json({'correct': result})
 
 @app.route('/api/<int:guild_id>/game/start', methods=['POST'])
 async def api_game_start(guild_id):
@@ -634,13 +690,13 @@ async def api_game_start(guild_id):
     
     guild = get_target_guild(guild_id)
     cog = get_bot_cog()
-    if not guild or not cog: return jsonify({'error': 'No guild'}), 400
+    if not guild or not cog: return _json({'error': 'No guild'}, 400)
     
     success, message = await cog.start_game_logic(guild.id, search=search, mode=mode, voice_channel_id=voice_id)
     if success:
-        return jsonify({'status': 'ok'})
+        return _json({'status': 'ok'})
     else:
-        return jsonify({'error': message}), 400
+        return _json({'error': message}, 400)
 
 @app.route('/api/<int:guild_id>/game/control/<action>', methods=['POST'])
 async def api_game_web_control(guild_id, action):
@@ -649,12 +705,12 @@ async def api_game_web_control(guild_id, action):
     cog = get_bot_cog()
     if not guild or not cog: 
         log_error(f"Web Control Error: Guild {guild_id} or Cog not found")
-        return jsonify({'error': 'No guild'}), 400
+        return _json({'error': 'No guild'}, 400)
     
     state = cog.get_state(guild.id)
     if not state.game or not state.game.active:
         log_error(f"Web Control Error: No active game for guild {guild.id}")
-        return jsonify({'error': 'No active game'}), 400
+        return _json({'error': 'No active game'}, 400)
     
     g = state.game
     if action == 'more_time':
@@ -666,4 +722,4 @@ async def api_game_web_control(guild_id, action):
     elif action == 'stop':
         await g.stop()
         
-    return jsonify({'status': 'ok'})
+    return _json({'status': 'ok'})
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The bot modules read their token, cache dir and JSON files at import time,
+# so point them at a scratch directory before any test imports them.
+os.environ.setdefault('DISCORD_TOKEN', 'test-token')
+os.chdir(tempfile.mkdtemp(prefix='pimusic-tests-'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+
+
+class FakeCtx:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, *args, **kwargs):
+        self.sent.append((args, kwargs))
+        return SimpleNamespace(edit=self.send)
+
+
+def make_game(monkeypatch, songs):
+    calls = []
+
+    def fake_extract(loop, opts, url, background=False):
+        calls.append((url, background))
+        fut = loop.create_future()
+        fut.set_result({'url': f'stream://{url}'})
+        return asyncio.shield(fut)
+
+    monkeypatch.setattr(bot, 'ydl_extract', fake_extract)
+    cog = SimpleNamespace(bot=SimpleNamespace(loop=asyncio.get_running_loop()))
+    game = bot.GuessGame(cog, FakeCtx())
+    for song in songs:
+        game.songs_pool.append(song)
+        game.pooled_ids.add(song['id'])
+
+    async def no_segment(extra=0): pass
+    game.play_segment = no_segment
+    return game, calls
+
+
+SONGS = [{'id': f'vid{i}', 'title': f'Song {i}', 'author': f'Artist {i}'} for i in range(4)]
+
+
+def test_next_song_prefetches_current_and_next(monkeypatch):
+    async def run():
+        game, calls = make_game(monkeypatch, [dict(s) for s in SONGS])
+        await game.next_song()
+
+        assert game.current_song['id'] == 'vid0'
+        assert game.clean_title == 'song 0'
+        assert set(game.stream_infos) == {'vid0', 'vid1'}
+        # Only the pool head is a background prefetch
+        assert sorted(calls) == [('vid0', False), ('vid1', True)]
+        assert (await game.stream_info('vid0'))['url'] == 'stream://vid0'
+
+        # The next round reuses the prefetched future and drops the finished song's
+        calls.clear()
+        prefetched = game.stream_infos['vid1']
+        await game.next_song()
+        assert game.current_song['id'] == 'vid1'
+        assert game.stream_infos['vid1'] is prefetched
+        assert set(game.stream_infos) == {'vid1', 'vid2'}
+        assert calls == [('vid2', True)]
+        assert game.played_ids == {'vid0', 'vid1'}
+
+    asyncio.run(run())
+
+
+def test_stream_info_is_shared(monkeypatch):
+    async def run():
+        game, calls = make_game(monkeypatch, [])
+        game.current_song = SONGS[0]
+        assert game.stream_info('vid0') is game.stream_info('vid0')
+        assert calls == [('vid0', False)]
+
+    asyncio.run(run())
+
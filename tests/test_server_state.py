@@ -0,0 +1,32 @@
+from bot import ServerState
+from utils import Track
+
+
+def test_notify_bumps_version():
+    state = ServerState()
+    before = state.status_version()
+    assert state.status_version() == before
+    state.queue.append(Track('a', 'A'))
+    state.notify()
+    assert state.status_version() > before
+
+
+def test_drop_suggestions_only_notifies_on_change():
+    state = ServerState()
+    state.queue.extend([Track('a', 'A'), Track('b', 'B', suggested=True)])
+    before = state.status_version()
+    state.drop_suggestions()
+    assert [t.id for t in state.queue] == ['a']
+    after = state.status_version()
+    assert after > before
+    state.drop_suggestions()
+    assert state.status_version() == after
+
+
+def test_shuffle_keeps_suggestions_last():
+    state = ServerState()
+    state.queue.extend(Track(str(i), str(i)) for i in range(10))
+    state.queue.append(Track('s', 'S', suggested=True))
+    state.shuffle()
+    assert state.queue[-1].id == 's'
+    assert sorted(t.id for t in state.queue) == sorted([*map(str, range(10)), 's'])
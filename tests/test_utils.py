@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+
+import orjson
+import pytest
+
+import utils
+from utils import CacheIndex, Track
+
+
+def test_track_from_entry_and_dict_round_trip():
+    entry = {'id': 'abc', 'title': 'Song', 'uploader': 'Artist', 'duration': 185, 'webpage_url': 'https://x/abc'}
+    track = Track.from_entry(entry, suggested=True)
+    assert (track.id, track.author, track.duration, track.suggested) == ('abc', 'Artist', '3:05', True)
+
+    record = track.to_dict()
+    assert 'suggested' not in record
+    again = Track.from_dict(record)
+    assert again.to_dict() == record
+    assert not again.suggested
+
+
+def test_track_defaults_and_dict_access():
+    track = Track.from_entry({'id': 'xyz', 'title': 'T'})
+    assert track.author == 'Unknown'
+    assert track.duration == '0:00'
+    assert track.webpage == 'https://www.youtube.com/watch?v=xyz'
+    assert track['title'] == 'T'
+    assert track.get('suggested') is False
+    assert track.get('missing', 'dflt') == 'dflt'
+    with pytest.raises(KeyError):
+        track['missing']
+
+
+def _write_track(cache_dir, vid, size, mtime):
+    path = os.path.join(cache_dir, f"{vid}.webm")
+    with open(path, 'wb') as f: f.write(b'\0' * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_cache_index_scan_orders_by_mtime(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'CACHE_DIR', str(tmp_path))
+    _write_track(tmp_path, 'new', 30, 3000)
+    _write_track(tmp_path, 'old', 10, 1000)
+    _write_track(tmp_path, 'mid', 20, 2000)
+    (tmp_path / 'old.jpg').write_bytes(b'\0' * 5)
+
+    index = CacheIndex()
+    index.scan()
+    assert index.ids() == ['old', 'mid', 'new']
+    assert index.stats() == (3, 65)
+    assert 'mid' in index and 'gone' not in index
+
+
+def test_cache_index_evicts_least_recently_played(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'CACHE_DIR', str(tmp_path))
+    index = CacheIndex()
+    for i, vid in enumerate(('a', 'b', 'c')):
+        _write_track(tmp_path, vid, 10, 1000 + i)
+        index.add(vid)
+    index.add('missing') # Nothing on disk, so nothing to index
+    assert index.ids() == ['a', 'b', 'c']
+
+    index.touch('a')
+    assert index.ids() == ['b', 'c', 'a']
+    assert index.pop_oldest(15) == ['b', 'c']
+    assert index.ids() == ['a']
+    assert index.total_size == 10
+
+
+def test_ydl_extract_coalesces_identical_calls(monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    class FakeYDL:
+        def extract_info(self, url, download=False):
+            calls.append(url)
+            release.wait(5)
+            return {'id': url}
+
+    monkeypatch.setattr(utils, 'get_ydl', lambda opts: FakeYDL())
+    opts = {}
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        first = utils.ydl_extract(loop, opts, 'vid')
+        second = utils.ydl_extract(loop, opts, 'vid')
+        other = utils.ydl_extract(loop, opts, 'other')
+        # A cancelled caller doesn't cancel the shared extraction
+        first.cancel()
+        release.set()
+        assert await second == {'id': 'vid'}
+        assert await other == {'id': 'other'}
+        await asyncio.sleep(0)
+        assert not utils._inflight
+
+    asyncio.run(run())
+    assert sorted(calls) == ['other', 'vid']
+
+
+def test_save_json_later_coalesces_writes(tmp_path, monkeypatch):
+    writes = []
+    real_write = utils._write_file
+    monkeypatch.setattr(utils, '_write_file', lambda name, payload: writes.append(name) or real_write(name, payload))
+    target = str(tmp_path / 'settings.json')
+    data = {'n': 0}
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for n in range(1, 4):
+            data['n'] = n
+            utils.save_json_later(loop, target, data, delay=0.01)
+        await asyncio.sleep(0.05)
+        await loop.run_in_executor(utils._save_pool, lambda: None) # Wait for the queued write
+
+    asyncio.run(run())
+    assert writes == [target]
+    with open(target, 'rb') as f:
+        assert orjson.loads(f.read()) == {'n': 3}
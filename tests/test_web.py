@@ -0,0 +1,54 @@
+import asyncio
+
+from quart.testing import WebsocketResponseError
+
+import web
+
+
+def test_status_socket_rejects_missing_token():
+    async def run():
+        client = web.app.test_client()
+        try:
+            async with client.websocket('/ws/1/status') as ws:
+                await ws.receive()
+        except WebsocketResponseError as e:
+            return e.response.status_code
+
+    assert asyncio.run(asyncio.wait_for(run(), 5)) == 403
+
+
+def _stub_cog(monkeypatch):
+    from types import SimpleNamespace
+    from bot import ServerState
+
+    guild = SimpleNamespace(id=1, name='Guild')
+    state = ServerState()
+    cog = SimpleNamespace(
+        web_auth_token='secret',
+        bot=SimpleNamespace(get_guild=lambda gid: guild if gid == 1 else None, voice_clients=[], guilds=[guild]),
+        get_state=lambda gid: state,
+    )
+    monkeypatch.setattr(web, 'music_cog', cog)
+    return state
+
+
+def test_status_revalidation_answers_304(monkeypatch):
+    state = _stub_cog(monkeypatch)
+    auth = {'Cookie': 'pi_music_auth=secret'}
+
+    async def run():
+        client = web.app.test_client()
+        first = await client.get('/api/1/status', headers=auth)
+        assert first.status_code == 200
+        etag = first.headers['ETag']
+        assert (await first.get_json())['v'] == state.status_version()
+
+        again = await client.get('/api/1/status', headers={**auth, 'If-None-Match': etag})
+        assert again.status_code == 304
+
+        state.notify()
+        changed = await client.get('/api/1/status', headers={**auth, 'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+
+    asyncio.run(run())